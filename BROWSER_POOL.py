@@ -0,0 +1,203 @@
+import os  # Папки кэша браузеров и чтение /proc
+import time  # Замер времени запуска браузера
+import atexit  # Закрытие браузеров при завершении процесса
+import logging  # Ведение журнала событий и ошибок
+import threading  # Пул используется из нескольких потоков
+from contextlib import contextmanager  # Выдача браузера в виде блока with
+import METRICS  # Замеры времени запуска браузеров
+
+CHROMEDRIVER_PATH = '/usr/bin/chromedriver'  # Путь к chromedriver
+DEFAULT_SIZE = 2  # Максимальное количество одновременно запущенных браузеров
+MAX_USES = 50  # Браузер перезапускается после указанного числа загрузок
+MAX_MEMORY_MB = 1024  # Браузер перезапускается, если вместе с дочерними процессами занимает больше памяти
+CACHE_DIR = 'browser_cache'  # Кэш браузеров: статические файлы страницы не скачиваются заново после перезапуска
+
+# Запросы, которые браузер не выполняет: картинки, шрифты и счётчики посещаемости не нужны для чтения списка
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*mc.yandex.ru*', '*top-fwz1.mail.ru*',
+]
+
+
+# Функция подсчёта памяти (RSS, МБ) процесса и всех его потомков по данным /proc; None, если /proc недоступен
+def process_tree_memory_mb(pid):
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            pending.extend(children.get(current, []))
+            try:
+                with open(f'/proc/{current}/status') as f:
+                    total += next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+            except OSError:
+                continue
+        return total / 1024
+    except OSError:
+        return None
+
+
+# Функция запуска Chrome без интерфейса с блокировкой лишних запросов; slot - номер места в пуле,
+# у каждого места своя папка кэша, которая переживает перезапуск браузера
+def start_browser(slot):
+    # Selenium импортируется только при использовании этого способа загрузки
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument('--disable-gpu')  # Отключаем GPU для ускорения загрузки
+    chrome_options.add_argument('--headless')  # Режим без графического интерфейса для серверного использования
+    chrome_options.add_argument(f'--disk-cache-dir={os.path.abspath(os.path.join(CACHE_DIR, f"slot-{slot}"))}')
+    chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    browser = webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=chrome_options)
+    # Блокировка запросов через протокол DevTools; кэш браузера остаётся включённым
+    browser.execute_cdp_cmd('Network.enable', {})
+    browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+    browser.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': False})
+    return browser
+
+
+# Функция памяти, занятой браузером (chromedriver и все процессы Chrome)
+def browser_memory_mb(browser):
+    process = getattr(getattr(browser, 'service', None), 'process', None)
+    return process_tree_memory_mb(process.pid) if process is not None else None
+
+
+# Класс одного запущенного браузера в пуле
+class Session:
+    def __init__(self, browser, slot, startup_seconds):
+        self.browser = browser
+        self.slot = slot
+        self.startup_seconds = startup_seconds
+        self.uses = 0
+
+
+# Класс пула браузеров: браузеры остаются запущенными между загрузками и перезапускаются
+# после max_uses загрузок, при превышении max_memory_mb или после ошибки
+class BrowserPool:
+    def __init__(self, size=DEFAULT_SIZE, max_uses=MAX_USES, max_memory_mb=MAX_MEMORY_MB,
+                 factory=start_browser, memory=browser_memory_mb):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.factory = factory  # Функция запуска браузера по номеру места
+        self.memory = memory  # Функция измерения памяти браузера
+        self.condition = threading.Condition()
+        self.idle = []  # Свободные запущенные браузеры
+        self.free_slots = list(range(size))  # Места, на которых браузер ещё не запущен
+        self.stats = {'started': 0, 'reused': 0, 'recycled': 0, 'startup_seconds': 0.0}
+
+    # Метод выдачи браузера: свободный запущенный, новый на свободном месте или ожидание освобождения
+    @contextmanager
+    def session(self):
+        with self.condition:
+            while not self.idle and not self.free_slots:
+                self.condition.wait()
+            session = self.idle.pop() if self.idle else None
+            slot = self.free_slots.pop(0) if session is None else None
+            if session is not None:
+                self.stats['reused'] += 1
+        if session is None:
+            try:
+                session = self.start(slot)
+            except BaseException:
+                self.release_slot(slot)
+                raise
+        ok = False
+        try:
+            yield session.browser
+            ok = True
+        finally:
+            session.uses += 1
+            self.give_back(session, ok)
+
+    # Метод запуска браузера с замером времени
+    def start(self, slot):
+        started = time.perf_counter()
+        with METRICS.timed('selenium.session_start'):
+            browser = self.factory(slot)
+        seconds = time.perf_counter() - started
+        with self.condition:
+            self.stats['started'] += 1
+            self.stats['startup_seconds'] += seconds
+        logging.info(f'Браузер {slot} запущен за {seconds:.2f} с')
+        return Session(browser, slot, seconds)
+
+    # Метод возврата браузера в пул или его закрытия, если пора перезапустить
+    def give_back(self, session, ok):
+        reason = None
+        if not ok:
+            reason = 'ошибка'
+        elif session.uses >= self.max_uses:
+            reason = f'{session.uses} загрузок'
+        else:
+            memory = self.memory(session.browser)
+            if memory is not None and memory > self.max_memory_mb:
+                reason = f'память {memory:.0f} МБ'
+        if reason is None:
+            with self.condition:
+                self.idle.append(session)
+                self.condition.notify()
+            return
+        logging.info(f'Браузер {session.slot} перезапускается: {reason}')
+        self.quit(session)
+        with self.condition:
+            self.stats['recycled'] += 1
+        self.release_slot(session.slot)
+
+    def release_slot(self, slot):
+        with self.condition:
+            self.free_slots.append(slot)
+            self.condition.notify()
+
+    @staticmethod
+    def quit(session):
+        try:
+            session.browser.quit()
+        except Exception as e:
+            logging.warning(f'Браузер {session.slot} не закрылся: {e}')
+
+    # Сводка работы пула: запущено браузеров, среднее время запуска, повторных использований, перезапусков
+    def summary(self):
+        with self.condition:
+            stats = dict(self.stats)
+        stats['average_startup_seconds'] = round(stats['startup_seconds'] / stats['started'], 3) \
+            if stats['started'] else None
+        stats['startup_seconds'] = round(stats['startup_seconds'], 3)
+        return stats
+
+    # Метод закрытия всех свободных браузеров
+    def close(self):
+        with self.condition:
+            sessions, self.idle = self.idle, []
+        for session in sessions:
+            self.quit(session)
+        if sessions or self.stats['started']:
+            summary = self.summary()
+            logging.info(f"Браузеры: запущено {summary['started']} (в среднем за {summary['average_startup_seconds']} с), "
+                         f"повторных использований {summary['reused']}, перезапусков {summary['recycled']}")
+
+
+pool = None  # Общий пул процесса, создаётся при первом обращении
+pool_lock = threading.Lock()
+
+
+# Функция получения общего пула процесса; браузеры закрываются при завершении процесса
+def get_pool():
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = BrowserPool()
+            atexit.register(pool.close)
+        return pool
@@ -1,145 +1,361 @@
-import openpyxl # Импорт библиотеки для работы с Excel файлами
-from openpyxl.styles import PatternFill # Импорт класса для применения заливки ячеек в Excel
 from datetime import datetime # Импорт класса для работы с датой и временем
 from dadata import Dadata # Импорт клиента DaData для работы с данными компаний
 import pandas as pd # Импорт библиотеки для анализа и обработки данных
 import time # Импорт модуля для работы с системным временем
 import logging # Импорт модуля для логирования
+import argparse # Импорт модуля для разбора аргументов командной строки
+import random # Импорт модуля для добавления случайной задержки между повторами
+import sqlite3 # Импорт модуля для работы с локальной базой SQLite (кэш ответов DaData)
+import json # Импорт модуля для сериализации ответов DaData
+from concurrent.futures import ThreadPoolExecutor, as_completed # Импорт пула потоков для параллельных запросов
+import os # Импорт модуля для работы с файлами (журнал контрольных точек)
+from HTTP_CLIENT import TokenBucket # Общий ограничитель частоты запросов
+import STORE # Хранилище данных о компаниях
+import METRICS # Замеры времени вызовов и этапов
+import NAMES # Нормализация названий компаний
 
-# Настройка базовых параметров логирования: имя файла, уровень логирования и формат сообщений
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler('changes.log', mode='w'),  # Логи будут записываться в файл changes.log
-                        logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
-                    ]
-                )
-
-# Определение функции для извлечения имени компании из текста
-def extract_name_in_quotes(text, gosuslugi_name):
-    # Проверка на NaN (не число) значения
-    if pd.isna(text):
-        return text
-
-    # Список ключевых слов для проверки в тексте
-    keywords = ["ТРАНСЭНЕРГО", "ГАЗПРОМ ЭНЕРГОСБЫТ ТЮМЕНЬ", "ОБОРОНЭНЕРГО", "ДЭК", "ОЭК", "АТОМЭНЕРГОСБЫТ"]
-
-    # Преобразование текста в верхний регистр для унификации сравнения
-    text = str(text).upper()
-
-    # Проверка на наличие ключевых слов в тексте или извлечение текста в кавычках
-    if any(keyword in text for keyword in keywords):
-        return gosuslugi_name
-    elif '"' in text:
-        start = text.find('"') + 1  # Индекс начала текста в кавычках
-        end = text.find('"', start)  # Индекс конца текста в кавычках
-        return text[start:end]  # Возврат текста между кавычками
-    else:
-        return text  # Возврат исходного текста, если условия не выполнены
 
-# Основной цикл выполнения
-while True:
+# Токен для аутентификации в API DaData
+token = "" #В кавычки нужно вставить API ключ Dadata
+
+# Словарь для перевода статусов компаний
+status_translation = {
+    "ACTIVE": "Действующая",
+    "LIQUIDATING": "Ликвидируется",
+    "LIQUIDATED": "Ликвидирована",
+    "BANKRUPT": "Банкротство",
+    "REORGANIZING": "В процессе присоединения к другому юрлицу, с последующей ликвидацией"
+}
+
+# Ограничения DaData: не более 30 запросов в секунду с одного IP, берём с запасом
+DEFAULT_RPS = 20  # Допустимое число запросов в секунду
+DEFAULT_WORKERS = 8  # Число одновременных запросов в параллельном режиме
+DEFAULT_RETRIES = 3  # Число повторных попыток для одного ИНН
+DEFAULT_BACKOFF = 1.0  # Базовая пауза (в секундах) перед повтором, удваивается с каждой попыткой
+
+CACHE_PATH = 'dadata_cache.sqlite'  # Файл кэша ответов DaData
+DEFAULT_CACHE_TTL_HOURS = 24  # Время жизни записи кэша в часах
+MAX_CACHE_TTL_HOURS = 7 * 24  # Предел времени жизни записи, которая не меняется от запроса к запросу
+JOURNAL_PATH = 'check_status.journal.jsonl'  # Журнал контрольных точек для возобновления прерванного запуска
+
+
+# Функция для запроса данных о компании по ИНН с повторными попытками и экспоненциальной паузой
+def fetch_party(dadata, inn, limiter=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()  # Ожидание разрешения ограничителя частоты
+        try:
+            with METRICS.timed('dadata.find_by_id'):
+                return dadata.find_by_id("party", inn)
+        except Exception as e:
+            if attempt == retries:
+                raise  # Попытки исчерпаны - ошибка передаётся выше
+            delay = backoff * 2 ** attempt + random.uniform(0, backoff)  # Пауза со случайным разбросом
+            logging.warning(f'ИНН {inn}: ошибка запроса к DaData ({e}), повтор через {delay:.1f} с')
+            time.sleep(delay)
+
+
+# Функция для запроса одного ИНН, ошибка не прерывает обработку остальных строк
+def fetch_one(dadata, inn, limiter=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
     try:
-        # Токен для аутентификации в API DaData
-        token = "" #В кавычки нужно вставить API ключ Dadata
-        # Инициализация клиента DaData с токеном
-        dadata = Dadata(token)
-
-        # Словарь для перевода статусов компаний
-        status_translation = {
-            "ACTIVE": "Действующая",
-            "LIQUIDATING": "Ликвидируется",
-            "LIQUIDATED": "Ликвидирована",
-            "BANKRUPT": "Банкротство",
-            "REORGANIZING": "В процессе присоединения к другому юрлицу, с последующей ликвидацией"
-        }
-
-        # Загрузка рабочей книги Excel
-        workbook = openpyxl.load_workbook('companies.xlsx')
-        # Получение активного листа рабочей книги
-        sheet = workbook.active
-
-        # Сбор ИНН из колонки C и текущих статусов из колонки D
-        inn_list = [cell.value for cell in sheet['C'] if cell.value is not None]
-        current_statuses = [cell.value for cell in sheet['D'] if cell.value is not None]
-
-        # Инициализация списков для новых статусов, временных меток и дополнительных данных
-        new_statuses = []
-        timestamps = []
-        values = []
-        full_with_opfs = []
-
-        # Инициализация списка для сбора данных
-        data = []
-
-        # Обработка каждой записи в списке ИНН и текущих статусов
-        for index, (inn, current_status) in enumerate(zip(inn_list[1:], current_statuses[1:]), 2):
-            # Поиск данных о компании по ИНН через API DaData
-            result = dadata.find_by_id("party", inn)
-            # Получение статуса компании из ответа API
-            api_status = result[0]['data']['state']['status'] if result and 'data' in result[0] and 'state' in result[0][
-                'data'] and 'status' in result[0]['data']['state'] else 'Неизвестно'
-            # Перевод статуса на русский язык
-            new_status = status_translation.get(api_status, 'Неизвестно')
-            # Добавление нового статуса в список
-            new_statuses.append(new_status)
-            # Запись текущей временной метки
-            timestamps.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-
-            # Получение краткого и полного наименования компании из ответа API
-            value_data = result[0]['data']['name']['short_with_opf'] if result and 'data' in result[0] and 'name' in \
-                                                                               result[0]['data'] and 'full_with_opf' in \
-                                                                               result[0]['data']['name'] else 'Неизвестно'
-            full_with_opf_data = result[0]['data']['name']['full_with_opf'] if result and 'data' in result[0] and 'name' in \
-                                                                               result[0]['data'] and 'full_with_opf' in \
-                                                                               result[0]['data']['name'] else 'Неизвестно'
-
-            # Добавление полученных данных в соответствующие списки
-            values.append(value_data)
-            full_with_opfs.append(full_with_opf_data)
-
-            # Проверка на изменение статуса и добавление данных в список, если есть изменения
-            if new_status != current_status:
-                data.append({
-                    "GOSUSLUGI_NAME": sheet[f'B{index}'].value,
-                    "OLD_STATUS": current_status,
-                    "NEW_STATUS": new_status
-                })
-
-        # Создание DataFrame из списка изменений
-        changes_df = pd.DataFrame(data)
-
-        # Логирование изменений, если они есть
-        if not changes_df.empty:
-            logging.info('Изменения в компаниях:')
-            for _, row in changes_df.iterrows():
-                logging.info(f"{row['GOSUSLUGI_NAME']} изменил статус с {row['OLD_STATUS']} на {row['NEW_STATUS']}.")
-        else:
-            logging.info('Изменений нет.')
-
-        # Обновление листа Excel данными о новых статусах, временных метках и названиях компаний
-        for index, (status, timestamp, value, full_with_opf) in enumerate(zip(new_statuses, timestamps, values, full_with_opfs),
-                                                                          start=2):
-            sheet[f'D{index}'].value = status
-            sheet[f'E{index}'].value = timestamp
-            sheet[f'G{index}'].value = value
-            sheet[f'H{index}'].value = full_with_opf
-            sheet[f'I{index}'].value = extract_name_in_quotes(sheet[f'G{index}'].value, sheet[f'B{index}'].value)
-
-        # Применение красной заливки для неактивных компаний
-        red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-        for index, status in enumerate(new_statuses, start=2):
-            if status != "Действующая":
-                for col_letter in ['A', 'B', 'C', 'E', 'D', 'F', 'G', 'H', 'I', 'J']:
-                    sheet[f'{col_letter}{index}'].fill = red_fill
-
-        # Сохранение изменений в файл Excel
-        workbook.save('companies.xlsx')
-        # Выход из цикла
-        break
+        return inn, fetch_party(dadata, inn, limiter, retries, backoff), None
+    except Exception as e:
+        return inn, None, e
+
+
+# Функция-генератор для последовательного получения данных; выдаёт (ИНН, ответ, ошибка) по мере готовности
+def fetch_serial(dadata, inns, limiter=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    for inn in inns:
+        yield fetch_one(dadata, inn, limiter, retries, backoff)
+
+
+# Функция-генератор для параллельного получения данных; выдаёт (ИНН, ответ, ошибка) по мере готовности
+def fetch_concurrent(dadata, inns, limiter=None, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES,
+                     backoff=DEFAULT_BACKOFF):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_one, dadata, inn, limiter, retries, backoff) for inn in inns]
+        for future in as_completed(futures):
+            yield future.result()
+
 
+# Класс журнала контрольных точек: каждый полученный ответ дописывается в JSONL-файл сразу по готовности
+class Journal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path  # Путь к файлу журнала
+
+    # Метод чтения ранее сохранённых ответов (ИНН -> ответ DaData) для возобновления работы;
+    # ответы старше ttl_hours (как и записи кэша) не используются
+    def load(self, ttl_hours=DEFAULT_CACHE_TTL_HOURS):
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Последняя строка могла не дописаться при аварийном завершении
+                if time.time() - entry.get('fetched_at', 0) < ttl_hours * 3600:
+                    done[entry['inn']] = entry['payload']
+        return done
+
+    # Метод добавления ответа по одному ИНН в журнал вместе со временем запроса
+    def record(self, inn, payload):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'inn': str(inn), 'payload': payload, 'fetched_at': time.time()},
+                               ensure_ascii=False) + '\n')
+
+    # Метод удаления журнала после успешного переноса результатов в хранилище
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Класс постоянного кэша ответов DaData, ключом служит ИНН. Время жизни записи удваивается после каждого
+# повторного запроса с прежней датой актуальности (state.actuality_date), но не больше max_ttl_hours
+class DadataCache:
+    def __init__(self, path=CACHE_PATH, ttl_hours=DEFAULT_CACHE_TTL_HOURS, max_ttl_hours=MAX_CACHE_TTL_HOURS):
+        self.ttl = ttl_hours * 3600  # Время жизни записи в секундах
+        self.max_ttl = max(max_ttl_hours * 3600, self.ttl)  # Предел времени жизни неизменной записи
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS party (
+                                 inn TEXT PRIMARY KEY,
+                                 payload TEXT NOT NULL,
+                                 fetched_at REAL NOT NULL,
+                                 actuality_date INTEGER,
+                                 unchanged_count INTEGER NOT NULL DEFAULT 0)""")
+        # Кэш, созданный до появления счётчика неизменных запросов
+        if 'unchanged_count' not in [row[1] for row in self.conn.execute('PRAGMA table_info(party)')]:
+            self.conn.execute('ALTER TABLE party ADD COLUMN unchanged_count INTEGER NOT NULL DEFAULT 0')
+        self.hits = 0  # Количество ответов, взятых из кэша
+        self.misses = 0  # Количество ИНН, которые пришлось запросить в API
+        self.unchanged = 0  # Количество повторно запрошенных записей с прежней датой актуальности
+
+    # Метод получения актуального ответа из кэша (None, если записи нет или она устарела)
+    def get(self, inn):
+        row = self.conn.execute('SELECT payload, fetched_at, unchanged_count FROM party WHERE inn = ?',
+                                (str(inn),)).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl_of(row[2]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    # Метод расчёта времени жизни записи (в секундах) по числу повторных запросов без изменений
+    def ttl_of(self, unchanged_count):
+        return min(self.ttl * 2 ** min(unchanged_count, 32), self.max_ttl)
+
+    # Метод сохранения ответа API в кэш
+    def put(self, inn, payload):
+        actuality_date = actuality_date_of(payload)
+        previous = self.conn.execute('SELECT actuality_date, unchanged_count FROM party WHERE inn = ?',
+                                     (str(inn),)).fetchone()
+        # Дата актуальности не изменилась - запись в реестре осталась прежней, и время жизни увеличивается;
+        # иначе счётчик сбрасывается
+        unchanged_count = 0
+        if previous is not None and actuality_date is not None and previous[0] == actuality_date:
+            self.unchanged += 1
+            unchanged_count = previous[1] + 1
+        self.conn.execute('INSERT OR REPLACE INTO party (inn, payload, fetched_at, actuality_date, unchanged_count) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (str(inn), json.dumps(payload, ensure_ascii=False), time.time(), actuality_date,
+                           unchanged_count))
+
+    # Метод фиксации изменений и закрытия базы
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+# Функция для получения даты актуальности сведений о компании (state.actuality_date) из ответа DaData
+def actuality_date_of(result):
+    data = result[0].get('data', {}) if result else {}
+    return data.get('state', {}).get('actuality_date')
+
+
+# Функция для извлечения статуса и наименований компании из ответа DaData
+def parse_party(result):
+    data = result[0].get('data', {}) if result else {}
+    # Получение статуса компании из ответа API
+    api_status = data.get('state', {}).get('status', 'Неизвестно')
+    # Перевод статуса на русский язык
+    new_status = status_translation.get(api_status, 'Неизвестно')
+    # Получение краткого и полного наименования компании из ответа API
+    name = data.get('name', {})
+    if 'full_with_opf' in name:
+        value_data = name.get('short_with_opf', 'Неизвестно')
+        full_with_opf_data = name['full_with_opf']
+    else:
+        value_data = full_with_opf_data = 'Неизвестно'
+    return new_status, value_data, full_with_opf_data
+
+
+# Функция записи ответа DaData по одной компании в хранилище; возвращает новый статус.
+# Смена статуса фиксируется в истории статусов, смена статуса и имени для папки - в ленте изменений
+def apply_result(conn, company, result):
+    new_status, value, full_with_opf = parse_party(result)
+    name_for_folder = NAMES.name_for_folder(value, company['name_gosuslugi'])
+    if new_status != company['status']:
+        STORE.record_status_change(conn, company['id'], company['inn'], company['status'], new_status)
+        STORE.record_change(conn, STORE.STATUS_CHANGED, company['id'], company['inn'],
+                            {'status': company['status']}, {'status': new_status})
+    if name_for_folder != company['name_for_folder']:
+        STORE.record_change(conn, STORE.NAME_CHANGED, company['id'], company['inn'],
+                            {'name_for_folder': company['name_for_folder']}, {'name_for_folder': name_for_folder})
+        if company['name_for_folder'] is not None:
+            # Папка на Яндекс.Диске ищется и под прежним именем (по ленте изменений), но её нужно переименовать
+            old_key, new_key = (NAMES.folder_key(company['number'], name, company['inn'])
+                                for name in (company['name_for_folder'], name_for_folder))
+            logging.warning(f"Имя папки изменилось: '{old_key}' -> '{new_key}', папку нужно переименовать")
+    STORE.update_company(conn, company['id'],
+                         status=new_status,
+                         checked_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                         short_name=value,
+                         full_name=full_with_opf,
+                         name_for_folder=name_for_folder)
+    return new_status
+
+
+# Функция для разбора аргументов командной строки
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Обновление статусов компаний через API DaData')
+    parser.add_argument('--mode', choices=['serial', 'concurrent'], default='concurrent',
+                        help='Режим запросов к DaData: последовательный или параллельный')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Число одновременных запросов в параллельном режиме')
+    parser.add_argument('--rps', type=float, default=DEFAULT_RPS,
+                        help='Максимальное число запросов в секунду')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help='Число повторных попыток для одного ИНН')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_CACHE_TTL_HOURS,
+                        help='Время жизни записи кэша DaData в часах')
+    parser.add_argument('--force-refresh', action='store_true',
+                        help='Игнорировать кэш и запросить все ИНН заново')
+    return parser.parse_args(argv)
+
+
+# Основная функция обновления статусов; список компаний читается из хранилища - общей таблицы всех этапов
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Инициализация клиента DaData с токеном
+    dadata = Dadata(token)
+    # Общий для всех потоков ограничитель частоты запросов
+    limiter = TokenBucket(args.rps)
+
+    # Чтение компаний из хранилища
+    conn = STORE.connect()
+    companies = STORE.load_companies(conn)
+
+    # Пары (ИНН, текущий статус) для всех компаний
+    rows = [(company['inn'], company['status']) for company in companies]
+
+    # Ответы, сохранённые в журнале прерванного запуска, повторно не запрашиваются, пока не устарели;
+    # при --force-refresh журнал очищается, и запрашиваются все ИНН
+    journal = Journal()
+    if args.force_refresh:
+        journal.remove()
+    journaled = journal.load(args.cache_ttl)
+    if journaled:
+        logging.info(f'Возобновление прерванного запуска: в журнале {len(journaled)} ИНН')
+
+    # Ответы из журнала и кэша; в API уходят только отсутствующие или устаревшие ИНН
+    cache = DadataCache(ttl_hours=args.cache_ttl)
+    results = []
+    for inn, _ in rows:
+        result = journaled.get(str(inn))
+        if result is None and not args.force_refresh:
+            result = cache.get(inn)
+        results.append(result)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if args.force_refresh:
+        cache.misses = len(missing)
+
+    # Получение данных о компаниях из API DaData в выбранном режиме (повторяющиеся ИНН запрашиваются один раз)
+    started = time.monotonic()
+    inns = list(dict.fromkeys(rows[i][0] for i in missing))
+    if args.mode == 'concurrent':
+        fetched = fetch_concurrent(dadata, inns, limiter, args.workers, args.retries)
+    else:
+        fetched = fetch_serial(dadata, inns, limiter, args.retries)
+
+    # Каждый ответ сразу фиксируется в журнале и кэше; ошибка по одному ИНН не влияет на остальные
+    fetched_by_inn = {}
+    failed = {}
+    for inn, result, error in fetched:
+        if error is not None:
+            failed[inn] = error
+            logging.error(f'ИНН {inn}: не удалось получить данные DaData ({error})')
+            continue
+        journal.record(inn, result)
+        cache.put(inn, result)
+        fetched_by_inn[inn] = result
+    cache.close()
+    logging.info(f'DaData: {len(inns)} запросов за {time.monotonic() - started:.2f} с (режим {args.mode})')
+    logging.info(f'Кэш DaData: попаданий {cache.hits}, промахов {cache.misses}, '
+                 f'без изменений после повторного запроса {cache.unchanged}')
+
+    # Подстановка полученных ответов на места своих строк
+    for i in missing:
+        results[i] = fetched_by_inn.get(rows[i][0])
+
+    # Инициализация списка для сбора данных
+    data = []
+
+    # Обработка каждой записи и обновление в хранилище статусов, временных меток и названий компаний
+    for company, result in zip(companies, results):
+        # Компании с ошибкой запроса остаются без изменений
+        if result is None:
+            continue
+
+        new_status = apply_result(conn, company, result)
+
+        # Добавление данных в список, если статус изменился
+        if new_status != company['status']:
+            data.append({
+                "GOSUSLUGI_NAME": company['name_gosuslugi'],
+                "OLD_STATUS": company['status'],
+                "NEW_STATUS": new_status
+            })
+
+    # Создание DataFrame из списка изменений
+    changes_df = pd.DataFrame(data)
+
+    # Логирование изменений, если они есть
+    if not changes_df.empty:
+        logging.info('Изменения в компаниях:')
+        for _, row in changes_df.iterrows():
+            logging.info(f"{row['GOSUSLUGI_NAME']} изменил статус с {row['OLD_STATUS']} на {row['NEW_STATUS']}.")
+    else:
+        logging.info('Изменений нет.')
+
+    # Фиксация изменений в хранилище; после этого журнал больше не нужен
+    # (красная заливка недействующих компаний применяется при выгрузке в Excel)
+    conn.commit()
+    conn.close()
+    journal.remove()
+
+    # Итоговая сводка по запуску
+    logging.info(f'Итог: строк {len(rows)}, из журнала {len(journaled)}, из кэша {cache.hits}, '
+                 f'запрошено {len(fetched_by_inn)}, ошибок {len(failed)}')
+    if failed:
+        logging.warning(f"ИНН с ошибками (будут запрошены при следующем запуске): {', '.join(map(str, failed))}")
+    return failed
+
+
+if __name__ == '__main__':
+    # Настройка базовых параметров логирования: имя файла, уровень логирования и формат сообщений
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    try:
+        with METRICS.stage('check_status'):
+            main()
     except Exception as e:
         # Логирование исключения с трассировкой стека
         logging.error(f'Произошла ошибка: {str(e)}', exc_info=True)
-        # Пауза перед повторной попыткой выполнения цикла
-        time.sleep(5)
+    METRICS.write_reports()
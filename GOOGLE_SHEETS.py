@@ -1,50 +1,142 @@
 # Указание кодировки для файла, это важно для корректной работы с не ASCII символами
 # -*- coding: utf-8 -*-
 
-import pandas as pd  # Библиотека для работы с таблицами данных
 import gspread  # Библиотека для работы с Google Sheets
 from oauth2client.service_account import ServiceAccountCredentials  # Инструменты для авторизации через Google API
-from gspread_dataframe import set_with_dataframe  # Функция для записи DataFrame в Google Sheets
-from gspread_formatting import *  # Функции для форматирования ячеек в Google Sheets
-from openpyxl import load_workbook  # Для работы с файлами Excel
+import STORE  # Хранилище данных о компаниях
+import METRICS  # Замеры времени вызовов и этапов
 import logging  # Для логирования
+import numbers  # Для проверки числовых значений (включая типы numpy)
+import sys  # Аргументы командной строки
+from datetime import datetime, timedelta  # Время последней полной синхронизации
 
-# Настройка логирования: указываем файл для записи, уровень логирования и формат сообщений
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler('changes.log', mode='w'),  # Логи будут записываться в файл changes.log
-                        logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
-                    ]
-                )
-try:
-    # Настройка доступа к Google Sheets API с помощью файла учетных данных
-    scopes = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name('path_to_credentials.json', scopes) #в нужно вставить название своего файла с доступом к google
-    client = gspread.authorize(creds)
 
-    # Открываем Google Sheets документ по названию и выбираем первый лист
-    sheet = client.open('table_for_work').sheet1
-    urls = sheet.col_values(6)  # Получаем значения из шестого столбца
+COLUMNS = ["№", "NAME_FOR_FOLDER", "INN", "STATUS", "LAST_DATE", "URL"]  # Столбцы, переносимые в Google Sheets
+STATUS_COLUMN = COLUMNS.index("STATUS")  # Индекс столбца со статусом
+URL_COLUMN = COLUMNS.index("URL")  # Индекс столбца со ссылками, которые заполняются в самой Google-таблице
+HIGHLIGHT_COLUMNS = 7  # Количество столбцов (A:G), закрашиваемых у недействующих компаний
+BORDER_COLUMNS = 5  # Количество столбцов (A:E) с заголовком жирным шрифтом и границами
+MAX_REQUESTS_PER_BATCH = 500  # Максимальное количество изменений в одном запросе batchUpdate
+CONSUMER = 'google_sheets'  # Имя этапа в ленте изменений хранилища
+FULL_SYNC_CONSUMER = 'google_sheets_full'  # Отметка времени последней полной синхронизации
+FULL_SYNC_HOURS = 24  # Полная синхронизация (со сверкой всего листа и переносом ссылок) не реже раза в сутки
+# События, меняющие видимые в таблице столбцы (ссылки заполняются в самой таблице и не переносятся обратно)
+SHEET_CHANGE_TYPES = (STORE.COMPANY_ADDED, STORE.STATUS_CHANGED, STORE.NAME_CHANGED, STORE.DATES_CHANGED)
+
+RED_BACKGROUND = {'red': 1, 'green': 0.8, 'blue': 0.8}  # Светло-красный фон для недействующих компаний
+WHITE_BACKGROUND = {'red': 1, 'green': 1, 'blue': 1}  # Обычный фон
+SOLID_BORDER = {'style': 'SOLID'}  # Сплошная граница ячейки
+
+
+# Функция для преобразования значения DataFrame в строку так, как её покажет Google Sheets
+def cell_text(value):
+    if isinstance(value, numbers.Real) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+# Функция для описания значения ячейки в формате Sheets API (числа остаются числами)
+def cell_data(value):
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return {'userEnteredValue': {'numberValue': float(value)}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+# Функция для описания диапазона листа (индексы строк и столбцов начинаются с нуля, конец не включается)
+def grid_range(sheet_id, start_row, end_row, start_col, end_col):
+    return {'sheetId': sheet_id, 'startRowIndex': start_row, 'endRowIndex': end_row,
+            'startColumnIndex': start_col, 'endColumnIndex': end_col}
+
+
+# Функция для формирования запроса на изменение формата диапазона
+def format_request(sheet_id, start_row, end_row, start_col, end_col, cell_format, fields):
+    return {'repeatCell': {'range': grid_range(sheet_id, start_row, end_row, start_col, end_col),
+                           'cell': {'userEnteredFormat': cell_format}, 'fields': fields}}
+
+
+# Функция для формирования запроса на закрашивание строки в зависимости от статуса компании
+def background_request(sheet_id, r, status):
+    background = WHITE_BACKGROUND if status == 'Действующая' else RED_BACKGROUND
+    return format_request(sheet_id, r, r + 1, 0, HIGHLIGHT_COLUMNS,
+                          {'backgroundColor': background}, 'userEnteredFormat.backgroundColor')
+
+
+# Функция для формирования запросов на оформление заголовка и границ таблицы из length строк
+def layout_requests(sheet_id, length):
+    borders = {'top': SOLID_BORDER, 'bottom': SOLID_BORDER, 'left': SOLID_BORDER, 'right': SOLID_BORDER}
+    return [format_request(sheet_id, 0, 1, 0, BORDER_COLUMNS,
+                           {'textFormat': {'bold': True}}, 'userEnteredFormat.textFormat.bold'),
+            format_request(sheet_id, 0, length, 0, BORDER_COLUMNS,
+                           {'borders': borders}, 'userEnteredFormat.borders')]
+
 
-    # Загружаем существующий Excel файл и выбираем активный лист
-    wb = load_workbook('companies.xlsx')
-    ws = wb.active
+# Функция для сравнения текущего содержимого листа с новыми данными и формирования списка изменений
+def diff_requests(sheet_id, old_values, table, row_count):
+    header = list(table.columns)
+    new_rows = [header] + table.values.tolist()
+    width = len(header)
+    requests = []
 
-    # Очищаем значения в 13-м столбце (столбец L)
-    for row in ws.iter_rows(min_col=13, max_col=13):
-        for cell in row:
-            cell.value = None
+    # Добавление строк, если новых данных больше, чем строк на листе
+    if len(new_rows) > row_count:
+        requests.append({'appendDimension': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                                             'length': len(new_rows) - row_count}})
 
-    # Записываем URL в столбец L начиная с первой строки
-    for idx, url in enumerate(urls, start=1):
-        ws.cell(row=idx, column=13, value=url)
+    for r, row in enumerate(new_rows):
+        old_row = old_values[r] if r < len(old_values) else []
+        old_texts = [old_row[c] if c < len(old_row) else '' for c in range(width)]
+        changed = [c for c in range(width) if old_texts[c] != cell_text(row[c])]
+        if changed:
+            # Одна запись на строку: от первого до последнего изменившегося столбца
+            first, last = changed[0], changed[-1]
+            requests.append({'updateCells': {
+                'range': grid_range(sheet_id, r, r + 1, first, last + 1),
+                'rows': [{'values': [cell_data(value) for value in row[first:last + 1]]}],
+                'fields': 'userEnteredValue'}})
 
-    # Сохраняем изменения в Excel файле
-    wb.save('companies.xlsx')
+        # Цвет строки меняется только у новых строк и у строк с изменившимся статусом
+        if r > 0 and (r >= len(old_values) or STATUS_COLUMN in changed):
+            requests.append(background_request(sheet_id, r, row[STATUS_COLUMN]))
 
-    # Читаем данные из Excel файла в DataFrame
-    df = pd.read_excel('companies.xlsx')
+    # Лишние строки, оставшиеся от прошлой выгрузки, очищаются вместе с форматом
+    if len(old_values) > len(new_rows):
+        stale = grid_range(sheet_id, len(new_rows), len(old_values), 0, max(len(row) for row in old_values))
+        requests.append({'updateCells': {'range': stale, 'fields': 'userEnteredValue,userEnteredFormat'}})
+
+    # Заголовок и границы переформатируются только при изменении количества строк
+    if len(old_values) != len(new_rows):
+        requests += layout_requests(sheet_id, len(new_rows))
+    return requests
+
+
+# Функция для формирования изменений только по строкам из ленты изменений, без чтения листа.
+# positions - номера изменившихся строк данных, recolor - строки со сменившимся статусом,
+# old_length - количество строк на листе (с заголовком) до добавления новых компаний
+def row_requests(sheet_id, table, positions, recolor, old_length, row_count):
+    rows = table.values.tolist()
+    new_length = len(rows) + 1
+    requests = []
+    if new_length > row_count:
+        requests.append({'appendDimension': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                                             'length': new_length - row_count}})
+    for position in sorted(positions):
+        r = position + 1  # Строка листа (после заголовка)
+        # Ссылка (URL) заполняется в самой Google-таблице, и в хранилище она может быть устаревшей до полной
+        # сверки, поэтому записываются только столбцы до неё
+        requests.append({'updateCells': {
+            'range': grid_range(sheet_id, r, r + 1, 0, URL_COLUMN),
+            'rows': [{'values': [cell_data(value) for value in rows[position][:URL_COLUMN]]}],
+            'fields': 'userEnteredValue'}})
+        if r >= old_length or position in recolor:
+            requests.append(background_request(sheet_id, r, rows[position][STATUS_COLUMN]))
+    if old_length != new_length:
+        requests += layout_requests(sheet_id, new_length)
+    return requests
+
+
+# Функция для подготовки столбцов таблицы из строк хранилища
+def sheet_table(companies):
+    df = STORE.companies_to_dataframe(companies)
 
     # Заменяем пропущенные значения на пустые строки
     df.fillna("", inplace=True)
@@ -54,30 +146,114 @@ try:
     df['INN'] = df['INN'].astype('str')
 
     # Выбираем столбцы в нужном порядке для дальнейшей работы
-    selected_columns = df[["№", "NAME_FOR_FOLDER", "INN", "STATUS", "LAST_DATE", "URL"]]
+    return df[COLUMNS]
+
+
+# Функция проверки, пора ли выполнить полную синхронизацию
+def full_sync_due(conn):
+    row = STORE.read_offset(conn, FULL_SYNC_CONSUMER)
+    if row is None:
+        return True
+    return datetime.now() - datetime.strptime(row['committed_at'], '%Y-%m-%d %H:%M:%S') > timedelta(hours=FULL_SYNC_HOURS)
+
+
+# Функция для отправки изменений одним или несколькими запросами batchUpdate; возвращает число запросов
+def send_batches(spreadsheet, requests):
+    for start in range(0, len(requests), MAX_REQUESTS_PER_BATCH):
+        with METRICS.timed('gspread.batch_update'):
+            spreadsheet.batch_update({'requests': requests[start:start + MAX_REQUESTS_PER_BATCH]})
+    return -(-len(requests) // MAX_REQUESTS_PER_BATCH)
+
+
+# Основная функция синхронизации с Google Sheets; client - готовый клиент gspread (например, для бенчмарка).
+# Обычно переносятся только строки из ленты изменений; полная сверка листа выполняется при первом запуске,
+# раз в FULL_SYNC_HOURS или при full=True
+def main(client=None, full=False):
+    conn = STORE.connect()
+    offset, changes = STORE.read_changes(conn, CONSUMER)
+    last_seq = changes[-1]['seq'] if changes else (offset or 0)
+    changes = [change for change in changes if change['type'] in SHEET_CHANGE_TYPES]
+    full = full or offset is None or full_sync_due(conn)
+
+    # Лента пуста - обращений к API нет
+    if not full and not changes:
+        STORE.commit_offset(conn, CONSUMER, last_seq)
+        conn.commit()
+        conn.close()
+        logging.info('Google sheets: новых изменений в ленте нет, синхронизация пропущена.')
+        return
+
+    if client is None:
+        # Настройка доступа к Google Sheets API с помощью файла учетных данных
+        scopes = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        creds = ServiceAccountCredentials.from_json_keyfile_name('path_to_credentials.json', scopes) #в нужно вставить название своего файла с доступом к google
+        client = gspread.authorize(creds)
+
+    # Открываем Google Sheets документ по названию и выбираем первый лист
+    with METRICS.timed('gspread.open'):
+        spreadsheet = client.open('table_for_work')
+        sheet = spreadsheet.sheet1
+    read_requests = 0
 
-    # Очищаем все данные на листе Google Sheets перед записью новых
-    sheet.clear()
+    if full:
+        with METRICS.timed('gspread.get_all_values'):
+            old_values = sheet.get_all_values()  # Текущее содержимое листа читается один раз
+        read_requests += 1
 
-    # Записываем данные из DataFrame в Google Sheets начиная с первой строки и столбца
-    set_with_dataframe(sheet, selected_columns, row=1, col=1, include_column_header=True)
+        # Ссылки заполняются в самой Google-таблице: переносим их в хранилище по номеру компании
+        urls = {row[0]: row[URL_COLUMN] if len(row) > URL_COLUMN and row[URL_COLUMN] != '' else None
+                for row in old_values[1:]}
+        for company in STORE.load_companies(conn):
+            url = urls.get(str(company['number']))
+            if url != company['url']:
+                # Обновляются только изменившиеся ссылки
+                STORE.update_company(conn, company['id'], url=url)
+                STORE.record_change(conn, STORE.URL_CHANGED, company['id'], company['inn'],
+                                    {'url': company['url']}, {'url': url})
 
-    # Форматируем ячейки с определённым статусом, красим в светло-красный цвет
-    status_column_index = 5  # Статус находится в пятом столбце выбранных данных
-    red_background_format = CellFormat(backgroundColor=Color(1, 0.8, 0.8))
-    for index, row in selected_columns.iterrows():
-        if row['STATUS'] != 'Действующая':
-            format_cell_range(sheet, f'A{index + 2}:G{index + 2}', red_background_format)
+        # Сравниваем с содержимым листа и отправляем только изменившиеся ячейки и форматы
+        table = sheet_table(STORE.load_companies(conn))
+        requests = diff_requests(sheet.id, old_values, table, sheet.row_count)
+    else:
+        # Только строки компаний из ленты; строки листа идут в порядке компаний в хранилище
+        companies = STORE.load_companies(conn)
+        positions = {company['id']: position for position, company in enumerate(companies)}
+        affected = {positions[change['company_id']] for change in changes}
+        recolor = {positions[change['company_id']] for change in changes if change['type'] == STORE.STATUS_CHANGED}
+        added = sum(change['type'] == STORE.COMPANY_ADDED for change in changes)
+        requests = row_requests(sheet.id, sheet_table(companies), affected, recolor,
+                                len(companies) + 1 - added, sheet.row_count)
+    write_requests = send_batches(spreadsheet, requests)
 
-    # Форматируем заголовки столбцов, делаем текст жирным
-    format_cell_range(sheet, 'A1:E1', CellFormat(textFormat=TextFormat(bold=True)))
+    # Позиция в ленте сохраняется только после успешной отправки
+    STORE.commit_offset(conn, CONSUMER, last_seq)
+    if full:
+        STORE.commit_offset(conn, FULL_SYNC_CONSUMER, last_seq)
+    conn.commit()
+    conn.close()
 
-    # Добавляем границы вокруг ячеек
-    format_cell_range(sheet, 'A1:E{}'.format(len(selected_columns) + 1), CellFormat(borders=Borders(top=Border('SOLID'), bottom=Border('SOLID'), left=Border('SOLID'), right=Border('SOLID'))))
+    # Записываем информацию о переносе данных и количестве запросов к API в лог-файл
+    mode = 'полная сверка' if full else f'событий в ленте {len(changes)}'
+    if requests:
+        logging.info(f'Данные успешно перенесены в Google sheets! Изменений: {len(requests)} ({mode})')
+    else:
+        logging.info(f'Google sheets: изменений нет ({mode}).')
+    logging.info(f'Google Sheets API: запросов на чтение {read_requests}, на запись {write_requests}')
 
-    # Записываем информацию об успешном переносе данных в лог-файл
-    logging.info('Данные успешно перенесены в Google sheets!')
 
-except Exception as e:
-    # В случае возникновения ошибки записываем информацию об ошибке в лог
-    logging.error(f'Произошла ошибка: {str(e)}', exc_info=True)
+if __name__ == '__main__':
+    # Настройка логирования: указываем файл для записи, уровень логирования и формат сообщений
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    try:
+        with METRICS.stage('google_sheets'):
+            main(full='--full' in sys.argv[1:])
+    except Exception as e:
+        # В случае возникновения ошибки записываем информацию об ошибке в лог
+        logging.error(f'Произошла ошибка: {str(e)}', exc_info=True)
+    METRICS.write_reports()
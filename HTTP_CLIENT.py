@@ -0,0 +1,115 @@
+import requests  # Импорт модуля для отправки HTTP-запросов
+from requests.adapters import HTTPAdapter  # Адаптер с пулом соединений для сессии requests
+from concurrent.futures import ThreadPoolExecutor  # Пул потоков для параллельных запросов
+from email.utils import parsedate_to_datetime  # Разбор даты из заголовка Retry-After
+from datetime import datetime, timezone  # Работа с датой и временем
+import threading  # Синхронизация потоков
+import random  # Случайный разброс паузы между повторами
+import time  # Работа с системным временем
+import logging  # Логирование
+
+DEFAULT_TIMEOUT = (5, 30)  # Таймауты в секундах: на установку соединения и на чтение ответа
+DEFAULT_POOL_SIZE = 8  # Размер пула соединений и максимальное число одновременных запросов
+DEFAULT_RETRIES = 3  # Число повторных попыток для одного запроса
+DEFAULT_BACKOFF = 1.0  # Базовая пауза (в секундах) перед повтором, удваивается с каждой попыткой
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # Коды ответа, при которых запрос повторяется
+
+
+# Класс ограничителя частоты запросов по алгоритму "token bucket"
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # Скорость пополнения корзины (токенов в секунду)
+        self.capacity = capacity or max(rate, 1)  # Максимальное количество токенов (допустимый всплеск)
+        self.tokens = self.capacity  # Текущее количество токенов
+        self.updated = time.monotonic()  # Время последнего пополнения
+        self.lock = threading.Lock()  # Блокировка для работы из нескольких потоков
+
+    # Метод ожидания свободного токена перед очередным запросом
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Пополнение корзины пропорционально прошедшему времени
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Время до появления следующего токена
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Функция для вычисления паузы по заголовку Retry-After (число секунд или HTTP-дата)
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# Класс общего HTTP-клиента: пул соединений с keep-alive, таймауты, ограничение параллельности
+# и повторы с учётом 429 и Retry-After
+class HttpClient:
+    def __init__(self, headers=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, rps=None):
+        self.session = requests.Session()  # Сессия переиспользует TCP/TLS-соединения между запросами
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(headers or {})
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = TokenBucket(rps) if rps else None  # Необязательное ограничение частоты запросов
+        self.semaphore = threading.BoundedSemaphore(pool_size)  # Не больше pool_size запросов одновременно
+        self.lock = threading.Lock()
+        self.request_count = 0  # Количество отправленных запросов (включая повторы)
+
+    # Метод отправки запроса с повторами при сетевых ошибках и кодах из RETRY_STATUSES
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            with self.lock:
+                self.request_count += 1
+            delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)  # Пауза со случайным разбросом
+            try:
+                with self.semaphore:
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise  # Попытки исчерпаны - ошибка передаётся выше
+                logging.warning(f'{method} {url}: {e}, повтор через {delay:.1f} с')
+                time.sleep(delay)
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            # Сервер сам указал, сколько ждать, - это значение важнее собственной паузы
+            retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = retry_after
+            logging.warning(f'{method} {url}: код {response.status_code}, повтор через {delay:.1f} с')
+            response.close()  # Соединение возвращается в пул, а не остаётся занятым непрочитанным ответом
+            time.sleep(delay)
+
+    # Метод отправки GET-запроса
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    # Метод для параллельного применения функции к списку элементов (результаты в исходном порядке)
+    def map(self, func, items, workers=None):
+        with ThreadPoolExecutor(max_workers=workers or self.pool_size) as executor:
+            return list(executor.map(func, items))
+
+    # Метод закрытия всех соединений пула
+    def close(self):
+        self.session.close()
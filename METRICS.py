@@ -0,0 +1,166 @@
+import cProfile  # Профилирование этапов
+import json  # Итоговая сводка запуска
+import os  # Работа с файлами
+import threading  # Метрики обновляются из нескольких потоков
+import time  # Замер времени
+from contextlib import contextmanager  # Замеры в виде блоков with
+from datetime import datetime  # Время запуска в сводке и имена файлов профиля
+
+METRICS_PATH = 'metrics.prom'  # Файл метрик в текстовом формате Prometheus (для textfile collector node_exporter)
+SUMMARY_PATH = 'runs.jsonl'  # Сводки запусков, по одной строке JSON на запуск
+PROFILE_DIR = 'profiles'  # Папка для результатов cProfile
+PREFIX = 'ipr'  # Префикс имён метрик
+
+# Границы интервалов гистограммы времени вызова в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Класс гистограммы времени одного вида вызовов со счётчиками вызовов и ошибок
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)  # Количество вызовов не дольше соответствующей границы (без накопления)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, error=False):
+        self.count += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    # Оценка квантиля сверху - граница интервала, в который он попадает
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+
+# Класс набора метрик одного запуска
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.calls = {}  # Имя вызова -> Histogram
+        self.stages = {}  # Имя этапа -> {'seconds': ..., 'ok': ...}
+
+    def observe(self, call, seconds, error=False):
+        with self.lock:
+            self.calls.setdefault(call, Histogram()).observe(seconds, error)
+
+    def record_stage(self, stage, seconds, ok):
+        with self.lock:
+            self.stages[stage] = {'seconds': round(seconds, 3), 'ok': ok}
+
+    # Метрики в текстовом формате Prometheus
+    def prometheus(self):
+        lines = [f'# HELP {PREFIX}_stage_duration_seconds Время выполнения этапа в последнем запуске',
+                 f'# TYPE {PREFIX}_stage_duration_seconds gauge']
+        with self.lock:
+            for stage, result in self.stages.items():
+                lines.append(f'{PREFIX}_stage_duration_seconds{{stage="{stage}"}} {result["seconds"]}')
+            lines += [f'# HELP {PREFIX}_stage_success Этап завершился без ошибки (1) или с ошибкой (0)',
+                      f'# TYPE {PREFIX}_stage_success gauge']
+            for stage, result in self.stages.items():
+                lines.append(f'{PREFIX}_stage_success{{stage="{stage}"}} {int(result["ok"])}')
+
+            lines += [f'# HELP {PREFIX}_call_duration_seconds Время внешних вызовов и тяжёлых операций',
+                      f'# TYPE {PREFIX}_call_duration_seconds histogram']
+            for call, histogram in self.calls.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_call_duration_seconds_bucket{{call="{call}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_call_duration_seconds_bucket{{call="{call}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{PREFIX}_call_duration_seconds_sum{{call="{call}"}} {histogram.total:.6f}')
+                lines.append(f'{PREFIX}_call_duration_seconds_count{{call="{call}"}} {histogram.count}')
+
+            for name, attribute, help_text in (('calls_total', 'count', 'Количество вызовов'),
+                                               ('call_errors_total', 'errors', 'Количество вызовов с ошибкой')):
+                lines += [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} counter']
+                for call, histogram in self.calls.items():
+                    lines.append(f'{PREFIX}_{name}{{call="{call}"}} {getattr(histogram, attribute)}')
+
+        lines += [f'# HELP {PREFIX}_last_run_timestamp_seconds Время окончания последнего запуска',
+                  f'# TYPE {PREFIX}_last_run_timestamp_seconds gauge',
+                  f'{PREFIX}_last_run_timestamp_seconds {time.time():.0f}']
+        return '\n'.join(lines) + '\n'
+
+    # Сводка запуска в виде словаря
+    def summary(self):
+        with self.lock:
+            calls = {call: {'count': histogram.count, 'errors': histogram.errors,
+                            'total_s': round(histogram.total, 3), 'max_s': round(histogram.max, 3),
+                            'p50_s': histogram.quantile(0.5), 'p95_s': histogram.quantile(0.95)}
+                     for call, histogram in self.calls.items()}
+            return {'started_at': self.started_at.isoformat(timespec='seconds'),
+                    'finished_at': datetime.now().isoformat(timespec='seconds'),
+                    'stages': dict(self.stages), 'calls': calls}
+
+
+registry = Registry()  # Общий набор метрик процесса
+
+
+# Замер одного вызова: время попадает в гистограмму, исключение - в счётчик ошибок.
+# Используется как блок with или как декоратор функции
+@contextmanager
+def timed(call):
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registry.observe(call, time.perf_counter() - started, error)
+
+
+# Замер этапа; при profile=True этап выполняется под cProfile, результат сохраняется в PROFILE_DIR
+@contextmanager
+def stage(name, profile=False):
+    profiler = cProfile.Profile() if profile else None
+    started = time.perf_counter()
+    ok = False
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+        ok = True
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.prof"))
+        registry.record_stage(name, time.perf_counter() - started, ok)
+
+
+# Функция записи метрик в файл Prometheus (через временный файл, чтобы сборщик не прочитал его частично)
+def export_prometheus(path=METRICS_PATH):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(registry.prometheus())
+    os.replace(temporary, path)
+
+
+# Функция добавления сводки запуска в конец файла JSONL
+def append_summary(path=SUMMARY_PATH, **extra):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({**registry.summary(), **extra}, ensure_ascii=False) + '\n')
+
+
+# Функция сохранения всех отчётов по окончании запуска
+def write_reports(**extra):
+    export_prometheus()
+    append_summary(**extra)
@@ -0,0 +1,189 @@
+import re  # Регулярные выражения, собранные из таблиц правил
+import sys  # Аргументы командной строки
+import logging  # Ведение журнала событий
+from functools import lru_cache  # Запоминание результатов для повторяющихся названий
+import pandas as pd  # Обработка столбцов целиком
+import STORE  # Хранилище данных о компаниях
+
+# Сокращения организационно-правовых форм: сокращение и варианты написания полной формы.
+# Регистр букв и количество пробелов между словами не учитываются, поэтому формы, полное название которых
+# содержит другую форму, перечислены отдельно: более длинный вариант проверяется первым.
+# Например, 'Публичное акционерное общество "Ромашка"' - 'ПАО "Ромашка"' (а не 'Публичное АО "Ромашка"'),
+# 'Непубличное акционерное общество "Ромашка"' - 'НАО "Ромашка"', 'Акционерное общество "Ромашка"' - 'АО "Ромашка"'
+LEGAL_FORMS = [
+    ('ООО', ['Общество с ограниченной ответственностью', 'Общество с ограниченной ответственность']),
+    ('ЗАО', ['Закрытое акционерное']),
+    ('ПАО', ['Публичное акционерное общество']),
+    ('НАО', ['Непубличное акционерное общество']),
+    ('ОАО', ['Открытое акционерное общество']),
+    ('АО', ['Акционерное общество']),
+    ('МУП', ['Муниципальное унитарное предприятие']),
+]
+
+# Компании, для которых имя папки берётся из названия на госуслугах (краткое имя в DaData не подходит)
+KEEP_GOSUSLUGI_NAME = ["ТРАНСЭНЕРГО", "ГАЗПРОМ ЭНЕРГОСБЫТ ТЮМЕНЬ", "ОБОРОНЭНЕРГО", "ДЭК", "ОЭК", "АТОМЭНЕРГОСБЫТ"]
+
+QUOTES = '"«»„“”'  # Прямые кавычки, «ёлочки» и „лапки“
+OPENING_QUOTES = '«„'  # Всегда открывающие кавычки
+CLOSING_QUOTES = '»'  # Всегда закрывающие; остальные определяются по предыдущему символу
+CACHE_SIZE = 65536  # Количество запоминаемых результатов
+
+
+# Функция сборки таблицы правил в одно регулярное выражение: каждый вариант написания - именованная группа,
+# более длинные варианты проверяются первыми. Возвращает выражение и соответствие имени группы и сокращения
+def compile_legal_forms(rules):
+    variants = sorted(((variant, abbreviation) for abbreviation, variants in rules for variant in variants),
+                      key=lambda item: len(item[0]), reverse=True)
+    separator = r'\s+'
+    parts = [f"(?P<form{n}>{separator.join(map(re.escape, variant.split()))})" for n, (variant, _) in enumerate(variants)]
+    groups = {f'form{n}': abbreviation for n, (_, abbreviation) in enumerate(variants)}
+    return re.compile(rf"(?<!\w)(?:{'|'.join(parts)})(?!\w)", re.IGNORECASE), groups
+
+
+LEGAL_FORM_PATTERN, LEGAL_FORM_GROUPS = compile_legal_forms(LEGAL_FORMS)
+KEEP_PATTERN = re.compile('|'.join(map(re.escape, KEEP_GOSUSLUGI_NAME)))
+QUOTE_CHARS_PATTERN = re.compile(f'[{QUOTES}]')
+SPACES_PATTERN = re.compile(r'\s+')
+
+
+# Функция замены найденной полной формы на сокращение
+def legal_form_abbreviation(match):
+    return LEGAL_FORM_GROUPS[match.lastgroup]
+
+
+# Функция для сокращения организационно-правовой формы в названии компании
+@lru_cache(maxsize=CACHE_SIZE)
+def shorten_legal_form(name):
+    return LEGAL_FORM_PATTERN.sub(legal_form_abbreviation, name)
+
+
+# Функция сокращения организационно-правовых форм для столбца целиком
+def shorten_legal_forms(names):
+    return names.str.replace(LEGAL_FORM_PATTERN, legal_form_abbreviation, regex=True)
+
+
+# Функция получения текста в первых кавычках с учётом вложенности, без вложенных кавычек и лишних пробелов;
+# None, если кавычек нет. Прямая кавычка внутри кавычек открывает вложенные, если перед ней пробел или
+# открывающая кавычка, иначе закрывает: 'АО "ЭК "ВОСТОК"' - 'ЭК ВОСТОК', 'ПАО "КСК", ПАО "КСК-2"' - 'КСК'.
+# Если кавычки не закрыты - до конца строки
+def quoted_text(text):
+    depth = 0  # Уровень вложенности кавычек
+    start = None  # Начало текста в первых кавычках
+    opened = None  # Позиция последней открывающей кавычки
+    for position, char in enumerate(text):
+        if char not in QUOTES:
+            continue
+        previous = text[position - 1:position]
+        closing = char in CLOSING_QUOTES or (char not in OPENING_QUOTES and depth > 0
+                                             and not previous.isspace() and opened != position - 1)
+        if not closing:
+            if depth == 0:
+                start = position + 1
+            depth += 1
+            opened = position
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                return clean_quoted(text[start:position])
+    return None if start is None else clean_quoted(text[start:])
+
+
+# Функция удаления вложенных кавычек и лишних пробелов
+def clean_quoted(text):
+    return SPACES_PATTERN.sub(' ', QUOTE_CHARS_PATTERN.sub(' ', text)).strip()
+
+
+# Функция получения имени для папки (NAME_FOR_FOLDER) из краткого имени DaData:
+# текст в кавычках в верхнем регистре или название с госуслуг для компаний из KEEP_GOSUSLUGI_NAME
+def name_for_folder(text, gosuslugi_name):
+    # Проверка на NaN (не число) значения
+    if text is None or pd.isna(text):
+        return text
+    return cached_name_for_folder(str(text), gosuslugi_name)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_name_for_folder(text, gosuslugi_name):
+    text = text.upper()
+    if KEEP_PATTERN.search(text):
+        return gosuslugi_name
+    inner = quoted_text(text)
+    return text if inner is None else inner
+
+
+# Функция получения имён для папок для столбцов целиком; результат совпадает с name_for_folder по строкам
+def names_for_folder(texts, gosuslugi_names):
+    upper = texts.astype('object').where(texts.isna(), texts.astype(str).str.upper())
+    # Разбор вложенных кавычек не выражается регулярным выражением, поэтому выполняется по строкам
+    inner = upper.map(quoted_text, na_action='ignore')
+    result = inner.where(inner.notna(), upper)
+    keep = upper.str.contains(KEEP_PATTERN, na=False)
+    return result.where(~keep, gosuslugi_names).where(texts.notna(), texts)
+
+
+# Функция для формирования имени папки компании на Яндекс.Диске: номер, имя для папки и ИНН
+def folder_key(number, folder_name, inn):
+    return f"{number}. {folder_name} ({int(inn)})"
+
+
+# Функция сверки названий в хранилище с текущими правилами; возвращает DataFrame расхождений
+def find_mismatches(conn):
+    companies = pd.DataFrame([dict(company) for company in STORE.load_companies(conn)],
+                             columns=['id', 'inn', 'name_gosuslugi', 'short_name', 'name_for_folder'])
+    companies['new_name_gosuslugi'] = shorten_legal_forms(companies['name_gosuslugi'].astype('object'))
+    checked = companies['short_name'].notna()
+    companies['new_name_for_folder'] = companies['name_for_folder']
+    companies.loc[checked, 'new_name_for_folder'] = names_for_folder(companies.loc[checked, 'short_name'],
+                                                                     companies.loc[checked, 'name_gosuslugi'])
+    changed = differs(companies['new_name_gosuslugi'], companies['name_gosuslugi']) \
+        | differs(companies['new_name_for_folder'], companies['name_for_folder'])
+    return companies[changed]
+
+
+# Функция поэлементного сравнения столбцов, в которой два пропуска считаются равными
+def differs(new, old):
+    return (new != old) & ~(new.isna() & old.isna())
+
+
+# Функция обновления названий в хранилище по текущим правилам; изменения записываются в ленту
+def apply_mismatches(conn, mismatches):
+    for row in mismatches.itertuples(index=False):
+        fields = {}
+        for field in ('name_gosuslugi', 'name_for_folder'):
+            old, new = getattr(row, field), getattr(row, f'new_{field}')
+            if new != old and not (pd.isna(new) and pd.isna(old)):
+                fields[field] = new
+        STORE.update_company(conn, row.id, **fields)
+        STORE.record_change(conn, STORE.NAME_CHANGED, row.id, row.inn,
+                            {field: getattr(row, field) for field in fields}, fields)
+    conn.commit()
+
+
+# Запуск из командной строки: python NAMES.py check|apply|excel [файл]
+# check - список компаний, названия которых не соответствуют текущим правилам; apply - их исправление;
+# excel - та же сверка по значениям из выгрузки companies.xlsx (или указанного файла), хранилище не изменяется
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command == 'excel':
+        connection = STORE.connect(':memory:', sys.argv[2] if len(sys.argv) > 2 else STORE.EXCEL_PATH)
+    else:
+        connection = STORE.connect()
+    found = find_mismatches(connection)
+    for item in found.itertuples(index=False):
+        print(f'{item.inn}: {item.name_gosuslugi} -> {item.new_name_gosuslugi}; '
+              f'{item.name_for_folder} -> {item.new_name_for_folder}')
+    if command == 'apply':
+        apply_mismatches(connection, found)
+        # Папки на Яндекс.Диске нужно переименовать вручную: имя папки строится из NAME_FOR_FOLDER;
+        # до этого YA_DISK.py находит их под прежним именем по событиям name_changed
+        logging.info(f'Названия обновлены по текущим правилам: {len(found)}')
+    else:
+        print(f'Расхождений с текущими правилами: {len(found)}')
+    connection.close()
@@ -0,0 +1,216 @@
+import heapq  # Очередь проверок с приоритетом по времени
+import time  # Работа с системным временем
+import random  # Случайный разброс времени проверок
+import logging  # Ведение журнала событий и ошибок
+import argparse  # Разбор аргументов командной строки
+from collections import deque  # Учёт запросов за последний час
+from dadata import Dadata  # Клиент DaData
+from HTTP_CLIENT import TokenBucket  # Ограничитель частоты запросов
+import CHECK_STATUS  # Запрос и запись статусов компаний
+import YA_DISK  # Запрос и запись дат из папок на Яндекс.Диске
+import STORE  # Хранилище данных о компаниях
+import METRICS  # Замеры времени вызовов и экспорт метрик
+import BROWSER_POOL  # Пул браузеров, живущий столько же, сколько планировщик
+import main  # Сбор списка компаний ИПР и добавление новых компаний в хранилище
+
+STATUS_CHECK = 'status'  # Проверка статуса через DaData
+FOLDER_CHECK = 'folder'  # Проверка дат в папке на Яндекс.Диске
+CHECKS = (STATUS_CHECK, FOLDER_CHECK)  # Порядок важен: имя папки появляется после проверки статуса
+
+DEFAULT_BUDGET_PER_HOUR = 1000  # Допустимое число проверок (запросов к API) в час на все сервисы вместе
+BASE_INTERVAL_HOURS = {STATUS_CHECK: 24, FOLDER_CHECK: 6}  # Интервал первой проверки
+MAX_INTERVAL_HOURS = {STATUS_CHECK: 24 * 30, FOLDER_CHECK: 24 * 7}  # Предел роста интервала у стабильных компаний
+CHANGED_INTERVAL_HOURS = 1  # Интервал после обнаруженного изменения
+UNSTABLE_INTERVAL_HOURS = 6  # Предел интервала для компаний в процессе ликвидации или реорганизации
+UNSTABLE_STATUSES = {CHECK_STATUS.status_translation['LIQUIDATING'],
+                     CHECK_STATUS.status_translation['REORGANIZING']}
+JITTER = 0.1  # Разброс времени следующей проверки (±10%), чтобы проверки не собирались в одно время
+RELOAD_SECONDS = 600  # Период перечитывания списка компаний и записи метрик
+
+
+# Функция расчёта следующего интервала: после изменения - короткий, без изменений - вдвое длиннее прежнего
+def next_interval(check, interval, changed, status):
+    if changed:
+        return CHANGED_INTERVAL_HOURS
+    limit = UNSTABLE_INTERVAL_HOURS if check == STATUS_CHECK and status in UNSTABLE_STATUSES \
+        else MAX_INTERVAL_HOURS[check]
+    if interval is None:
+        return min(BASE_INTERVAL_HOURS[check], limit)
+    return min(interval * 2, limit)
+
+
+# Класс общего лимита запросов к API за скользящий час
+class HourlyBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.spent = deque()  # Время каждого запроса за последний час
+
+    # Метод возвращает, сколько секунд нужно подождать до появления свободного запроса
+    def wait_time(self, now):
+        while self.spent and self.spent[0] <= now - 3600:
+            self.spent.popleft()
+        return 0 if len(self.spent) < self.limit else self.spent[0] + 3600 - now
+
+    def spend(self, now):
+        self.spent.append(now)
+
+
+# Класс планировщика: очередь (время проверки, компания, вид проверки), сохраняемая в хранилище
+class Scheduler:
+    def __init__(self, conn, budget, dadata, limiter=None, scrape=None, scrape_hours=None):
+        self.conn = conn
+        self.budget = budget
+        self.dadata = dadata
+        self.limiter = limiter
+        self.scrape = scrape  # Функция сбора списка компаний ИПР (None - список собирает main.py из cron)
+        self.scrape_hours = scrape_hours  # Период сбора списка в часах
+        self.queue = []  # Куча (время проверки, порядок вида проверки, id компании, вид проверки)
+        self.intervals = {}  # (id компании, вид проверки) -> текущий интервал в часах
+        self.checks = 0  # Количество выполненных проверок
+
+    # Метод добавления в очередь компаний, которых в ней ещё нет (новые компании проверяются сразу)
+    def load(self):
+        saved = {(row['company_id'], row['check_type']): (row['due_at'], row['interval_hours'])
+                 for row in self.conn.execute('SELECT * FROM schedule')}
+        now = time.time()
+        added = 0
+        for company in STORE.load_companies(self.conn):
+            for check in CHECKS:
+                key = (company['id'], check)
+                if key in self.intervals:
+                    continue
+                due_at, interval = saved.get(key, (now, None))
+                self.intervals[key] = interval
+                heapq.heappush(self.queue, (due_at, CHECKS.index(check), company['id'], check))
+                added += 1
+        if added:
+            logging.info(f'Планировщик: добавлено проверок {added}, всего в очереди {len(self.queue)}')
+
+    # Метод проверки статуса одной компании; возвращает (изменился ли статус, текущий статус)
+    def check_status(self, company):
+        result = CHECK_STATUS.fetch_party(self.dadata, company['inn'], self.limiter)
+        new_status = CHECK_STATUS.apply_result(self.conn, company, result)
+        changed = new_status != company['status']
+        if changed:
+            logging.info(f"{company['name_gosuslugi']} изменил статус с {company['status']} на {new_status}.")
+        return changed, new_status
+
+    # Метод проверки дат в папке одной компании; возвращает (изменились ли даты, текущий статус)
+    def check_folder(self, company):
+        if company['name_for_folder'] is None:
+            return False, company['status']  # Имя папки появится после первой проверки статуса
+        # Папка ищется под текущим именем, а если её нет - под прежними (после смены имени для папки)
+        previous = STORE.previous_folder_names(self.conn, company['id']).get(company['id'], ())
+        for folder_name in YA_DISK.folder_names_of(company, previous):
+            items = YA_DISK.list_folder_items(YA_DISK.API_TOKEN, f"{YA_DISK.PARENT_PATH}/{folder_name}")
+            if items is not None:
+                break
+        else:
+            return False, company['status']  # Папки пока нет
+        if folder_name != YA_DISK.folder_name_of(company):
+            logging.warning(f"Папка {company['inn']} найдена под прежним именем '{folder_name}'")
+        changed = YA_DISK.apply_dates(self.conn, company, *YA_DISK.latest_dates(items), 'Scheduler')
+        return changed, company['status']
+
+    # Метод выполнения одной проверки и постановки следующей в очередь; изменения записываются сразу
+    def run_check(self, company_id, check, now):
+        company = STORE.load_company(self.conn, company_id)
+        interval = self.intervals[(company_id, check)]
+        self.budget.spend(now)
+        try:
+            changed, status = (self.check_status if check == STATUS_CHECK else self.check_folder)(company)
+            interval = next_interval(check, interval, changed, status)
+        except Exception as e:
+            # Ошибка не останавливает планировщик: проверка повторяется не позже чем через час
+            logging.error(f"ИНН {company['inn']}: проверка {check} завершилась ошибкой ({e})")
+            interval = min(interval or CHANGED_INTERVAL_HOURS, CHANGED_INTERVAL_HOURS)
+        due_at = now + interval * 3600 * random.uniform(1 - JITTER, 1 + JITTER)
+        self.intervals[(company_id, check)] = interval
+        self.conn.execute('INSERT OR REPLACE INTO schedule (company_id, check_type, due_at, interval_hours, checked_at) '
+                          'VALUES (?, ?, ?, ?, ?)', (company_id, check, due_at, interval, now))
+        self.conn.commit()
+        heapq.heappush(self.queue, (due_at, CHECKS.index(check), company_id, check))
+        self.checks += 1
+
+    # Метод сбора списка компаний ИПР; браузеры берутся из пула процесса, поэтому Chrome запускается один раз
+    # за всё время работы планировщика, а не при каждом сборе. Новые компании сразу попадают в очередь
+    def run_scrape(self):
+        try:
+            self.scrape()
+        except Exception as e:
+            logging.error(f'Планировщик: сбор списка компаний завершился ошибкой ({e})')
+        self.load()
+
+    # Основной цикл: выполнение проверок по мере наступления их времени в пределах лимита запросов
+    def run(self, max_checks=None):
+        reload_at = 0
+        scrape_at = 0 if self.scrape is not None else float('inf')
+        while max_checks is None or self.checks < max_checks:
+            now = time.time()
+            if now >= scrape_at:
+                self.run_scrape()
+                scrape_at = now + self.scrape_hours * 3600
+            if now >= reload_at:
+                self.load()
+                METRICS.export_prometheus()
+                reload_at = now + RELOAD_SECONDS
+            wait = min(reload_at, scrape_at) - now
+            if self.queue:
+                wait = min(wait, max(self.queue[0][0] - now, self.budget.wait_time(now)))
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            *_, company_id, check = heapq.heappop(self.queue)
+            self.run_check(company_id, check, now)
+
+
+# Функция для разбора аргументов командной строки
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Постоянно работающий планировщик проверок статусов и папок компаний')
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET_PER_HOUR,
+                        help='Допустимое число запросов к API в час')
+    parser.add_argument('--rps', type=float, default=CHECK_STATUS.DEFAULT_RPS,
+                        help='Максимальное число запросов к DaData в секунду')
+    parser.add_argument('--max-checks', type=int, help='Завершить работу после указанного числа проверок')
+    parser.add_argument('--scrape-hours', type=float,
+                        help='Собирать список компаний ИПР раз в указанное число часов (по умолчанию не собирать)')
+    parser.add_argument('--filters', default='',
+                        help='Значения фильтра по названию через запятую для сбора списка (как в main.py)')
+    parser.add_argument('--reset', action='store_true', help='Удалить сохранённое расписание и начать заново')
+    return parser.parse_args(argv)
+
+
+# Основная функция планировщика
+def main(argv=None):
+    args = parse_args(argv)
+    conn = STORE.connect()
+    if args.reset:
+        conn.execute('DELETE FROM schedule')
+        conn.commit()
+    scrape = None
+    if args.scrape_hours:
+        scrape_args = main.parse_args(['--filters', args.filters])
+        scrape = lambda: main.scrape(scrape_args)
+    scheduler = Scheduler(conn, HourlyBudget(args.budget), Dadata(CHECK_STATUS.token), TokenBucket(args.rps),
+                          scrape, args.scrape_hours)
+    try:
+        scheduler.run(args.max_checks)
+    except KeyboardInterrupt:
+        logging.info('Планировщик остановлен')
+    finally:
+        conn.close()
+        logging.info(f'Планировщик: выполнено проверок {scheduler.checks}')
+        browsers = {'browser_pool': BROWSER_POOL.pool.summary()} if BROWSER_POOL.pool is not None else {}
+        METRICS.write_reports(checks=scheduler.checks, **browsers)
+
+
+if __name__ == '__main__':
+    # Настройка логирования: журнал дописывается в changes.log и выводится в консоль
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    main()
@@ -0,0 +1,173 @@
+import json  # Работа с JSON-ответами и сохранёнными образцами ответа
+import re  # Модуль для работы с регулярными выражениями
+import time  # Библиотека для работы со временем
+import logging  # Библиотека для ведения логов
+import weakref  # Время загрузки страницы в каждом браузере без хранения самих браузеров
+from concurrent.futures import ThreadPoolExecutor  # Одновременная загрузка по нескольким значениям фильтра
+from HTTP_CLIENT import HttpClient  # Общий HTTP-клиент с пулом соединений и повторами
+import METRICS  # Замеры времени вызовов
+import NAMES  # Нормализация названий компаний
+import BROWSER_POOL  # Пул запущенных браузеров для загрузки через Selenium
+
+# Адрес JSON-запроса, которым Angular-страница ИПР загружает список компаний.
+# Берётся из вкладки Network инструментов разработчика браузера на странице
+# https://invest.gosuslugi.ru/epgu-forum/#/ipr. Пока адрес не задан, режим auto сразу использует Selenium
+IPR_API_URL = ""
+PAGE_TIMEOUT = 30  # Максимальное время ожидания элементов страницы в секундах
+LIST_TIMEOUT = 5  # Максимальное время ожидания обновления списка после ввода фильтра в секундах
+PAGE_MAX_AGE = 300  # Страница, открытая в браузере из пула дольше этого времени (в секундах), загружается заново
+FILTER_SELECTOR = 'input[ng-model="vm.iprFilter.esName"]'  # Поле фильтра по названию на странице ИПР
+
+ITEM_PATTERN = re.compile(r"^(.+) \((\d+)\)$")  # Элемент списка вида "Название (ИНН)"
+# Схема ответа JSON-запроса. Настоящий ответ ещё не снят (IPR_API_URL не задан), поэтому HTTP-загрузка
+# не считается рабочей: режим auto без адреса её не пробует, а разбор принимает только эту схему и при
+# несовпадении завершается ошибкой. Образец fixtures/ipr_companies.synthetic.json составлен вручную;
+# после снятия настоящего ответа его нужно сохранить как образец и поправить ключи ниже
+LIST_KEY = 'content'  # Ключ, под которым в ответе лежит список компаний
+NAME_KEY = 'name'  # Поле с названием компании
+INN_KEY = 'inn'  # Поле с ИНН
+
+
+# Функция для формирования записей о компаниях из пар (название, ИНН); общая для всех способов загрузки
+def make_company_records(pairs):
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')  # Форматирование текущей даты и времени
+    status = "Действующая"  # Статус компании, возможно, потребуется получать из другого источника
+    return [{"NAME_GOSUSLUGI": NAMES.shorten_legal_form(name), "INN": inn, "STATUS": status, "DATE/TIME": timestamp}
+            for name, inn in pairs]
+
+
+# Функция для разбора ответа JSON-запроса со списком компаний ИПР в пары (название, ИНН)
+def parse_ipr_json(payload):
+    records = payload.get(LIST_KEY) if isinstance(payload, dict) else None
+    if not isinstance(records, list):
+        raise ValueError(f'Ответ не соответствует схеме: нет списка "{LIST_KEY}"')
+
+    pairs = []
+    for record in records:
+        if not isinstance(record, dict) or not record.get(NAME_KEY) or not record.get(INN_KEY):
+            raise ValueError(f'Ответ не соответствует схеме: элемент без полей "{NAME_KEY}"/"{INN_KEY}": {record!r}')
+        pairs.append((record[NAME_KEY], str(record[INN_KEY])))
+    return pairs
+
+
+# Функция загрузки списка компаний напрямую из JSON-запроса без браузера
+def fetch_http(url=None, fixture=None, client=None):
+    if fixture is not None:
+        # Работа с сохранённым образцом ответа (для проверки разбора без сети)
+        with open(fixture, encoding='utf-8') as f:
+            payload = json.load(f)
+    else:
+        if not (url or IPR_API_URL):
+            raise ValueError('Не задан адрес JSON-запроса IPR_API_URL')
+        client = client or HttpClient()
+        with METRICS.timed('gosuslugi.ipr_list'):
+            response = client.get(url or IPR_API_URL, headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        payload = response.json()
+    return make_company_records(parse_ipr_json(payload))
+
+
+# Функция чтения элементов списка вида "Название (ИНН)"; тексты читаются одним вызовом JavaScript,
+# а не по одному через WebDriver
+def companies_in_list(browser):
+    texts = browser.execute_script("return Array.from(document.querySelectorAll('li'), e => e.innerText.trim());")
+    return [text for text in texts if ITEM_PATTERN.match(text)]
+
+
+page_loaded_at = weakref.WeakKeyDictionary()  # Браузер -> время загрузки в нём страницы ИПР
+
+
+# Функция чтения списка компаний со страницы в уже запущенном браузере; filter_value - значение фильтра
+# по названию. Если страница уже открыта (браузер из пула) не дольше PAGE_MAX_AGE, она не загружается заново,
+# меняется только фильтр
+def read_ipr_list(browser, url, filter_value=''):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    # Открытие страницы и ожидание появления поля фильтра. Angular меняет адрес после "#" сам, поэтому
+    # открыта ли страница, определяется по полю фильтра, а не по адресу. Страница, открытая давно
+    # (браузер из пула в долго работающем процессе), загружается заново, чтобы список был свежим
+    wait = WebDriverWait(browser, PAGE_TIMEOUT)
+    with METRICS.timed('selenium.page_load'):
+        loaded_at = page_loaded_at.get(browser)
+        fresh = loaded_at is not None and time.monotonic() - loaded_at < PAGE_MAX_AGE
+        if not (fresh and browser.find_elements(By.CSS_SELECTOR, FILTER_SELECTOR)):
+            browser.get(url)
+            page_loaded_at[browser] = time.monotonic()
+        input_element = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, FILTER_SELECTOR)))
+
+    needle = filter_value.lower()
+    # Перемещение к элементу, клик по нему и ввод значения фильтра, если на странице введено другое значение
+    ActionChains(browser).move_to_element(input_element).click().perform()
+    if input_element.get_attribute('value') != filter_value:
+        before = companies_in_list(browser)
+        input_element.clear()
+        if filter_value:
+            input_element.send_keys(filter_value)
+        # Ожидание обновления списка: он изменился и в нём нет элементов прежнего фильтра. Пустой список
+        # тоже результат (под фильтр ничего не подходит); список может и не измениться - например, при двух
+        # значениях подряд без подходящих компаний, поэтому по истечении LIST_TIMEOUT читается как есть
+        try:
+            WebDriverWait(browser, LIST_TIMEOUT).until(
+                lambda d: (texts := companies_in_list(d)) != before and all(needle in t.lower() for t in texts))
+        except TimeoutException:
+            pass
+    if not filter_value:
+        # Полный список без фильтра не бывает пустым: ожидание его загрузки
+        wait.until(companies_in_list)
+
+    return [ITEM_PATTERN.match(text).groups() for text in companies_in_list(browser) if needle in text.lower()]
+
+
+# Функция загрузки списка компаний через Selenium с ожиданием по условиям вместо фиксированных пауз.
+# Без browser используется запущенный браузер из общего пула (BROWSER_POOL.py)
+def fetch_selenium(url, browser=None, filter_value=''):
+    if browser is not None:
+        return make_company_records(read_ipr_list(browser, url, filter_value))
+    with BROWSER_POOL.get_pool().session() as pooled:
+        return make_company_records(read_ipr_list(pooled, url, filter_value))
+
+
+# Функция загрузки списка по одному значению фильтра; если страница не ответила вовремя, результат
+# по этому значению пустой, а загрузка по остальным значениям продолжается
+def fetch_selenium_filter(url, filter_value):
+    from selenium.common.exceptions import TimeoutException
+    try:
+        return fetch_selenium(url, filter_value=filter_value)
+    except TimeoutException:
+        logging.warning(f'Selenium: страница не ответила за {PAGE_TIMEOUT} с, значение фильтра "{filter_value}" пропущено')
+        return []
+
+
+# Функция одновременной загрузки списка по нескольким значениям фильтра браузерами из общего пула;
+# компании, найденные по нескольким значениям, возвращаются один раз
+def fetch_selenium_filters(url, filter_values, workers=None):
+    pool = BROWSER_POOL.get_pool()
+    with ThreadPoolExecutor(max_workers=workers or pool.size) as executor:
+        results = list(executor.map(lambda value: fetch_selenium_filter(url, value), filter_values))
+    records = {}
+    for result in results:
+        for record in result:
+            records.setdefault(record['INN'], record)
+    logging.info(f'Selenium: значений фильтра {len(filter_values)}, компаний {len(records)}')
+    return list(records.values())
+
+
+# Функция выбора способа загрузки: http, selenium или auto (http с переходом на selenium при ошибке)
+def fetch_companies(url, fetcher='auto', fixture=None, filters=None):
+    # Без адреса JSON-запроса и образца ответа HTTP-загрузка невозможна: в режиме auto она не пробуется
+    if fetcher == 'auto' and not IPR_API_URL and fixture is None:
+        fetcher = 'selenium'
+    if fetcher in ('http', 'auto'):
+        try:
+            return fetch_http(fixture=fixture)
+        except Exception as e:
+            if fetcher == 'http':
+                raise
+            logging.warning(f'Загрузка через HTTP не удалась ({e}), используется Selenium')
+    if filters:
+        return fetch_selenium_filters(url, filters)
+    return fetch_selenium(url)
@@ -0,0 +1,387 @@
+import os  # Работа с файлами папки координации
+import sys  # Путь к модулям в дочерних процессах
+import json  # Входные и выходные файлы частей
+import zlib  # Стабильный хеш ИНН (встроенный hash() меняется между запусками)
+import time  # Замер времени
+import socket  # Имя машины в отметке о захвате части
+import logging  # Ведение журнала событий и ошибок
+import argparse  # Разбор аргументов командной строки
+import threading  # Обновление отметки о захвате во время обработки части
+import multiprocessing  # Локальный запуск нескольких процессов
+from contextlib import contextmanager  # Обновление отметки о захвате на время блока with
+from datetime import datetime  # Даты в выходных файлах и время создания плана
+from dadata import Dadata  # Клиент DaData
+from HTTP_CLIENT import TokenBucket  # Ограничитель частоты запросов
+import CHECK_STATUS  # Запрос и запись статусов компаний
+import YA_DISK  # Запрос и запись дат из папок на Яндекс.Диске
+import NAMES  # Имя папки компании
+import STORE  # Хранилище данных о компаниях
+import METRICS  # Замеры времени вызовов
+
+SHARD_DIR = 'shards'  # Папка координации: план, входные и выходные файлы частей, отметки о захвате
+PLAN_FILE = 'plan.json'  # Описание текущего разбиения
+SHARD_STAGES = ['check_status', 'ya_disk']  # Этапы, выполняемые по частям
+DEFAULT_SHARDS = 4  # Количество частей по умолчанию
+HEARTBEAT_SECONDS = 60  # Как часто процесс обновляет время изменения своей отметки о захвате
+STALE_CLAIM_MINUTES = 30  # Отметка, которая не обновлялась дольше, оставлена аварийно завершившимся процессом
+
+
+# Функция определения номера части по ИНН: один и тот же ИНН всегда попадает в одну и ту же часть
+def shard_of(inn, shards):
+    return zlib.crc32(str(inn).encode('utf-8')) % shards
+
+
+# Функции путей к файлам одной части в папке координации
+def input_path(directory, shard):
+    return os.path.join(directory, f'input-{shard}.jsonl')
+
+
+def output_path(directory, shard):
+    return os.path.join(directory, f'output-{shard}.jsonl')
+
+
+def claim_path(directory, shard):
+    return os.path.join(directory, f'claim-{shard}')
+
+
+# Функция чтения плана разбиения
+def load_plan(directory=SHARD_DIR):
+    with open(os.path.join(directory, PLAN_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Функция записи файла целиком через временный файл, чтобы другие процессы не прочитали его частично
+def write_atomic(path, lines):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + '\n')
+    os.replace(temporary, path)
+
+
+# Функция чтения файла JSONL
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Функция разбиения компаний из хранилища на части: по входному файлу на часть и план в папке координации.
+# Файлы предыдущего разбиения удаляются
+def plan(conn, shards=DEFAULT_SHARDS, stages=SHARD_STAGES, directory=SHARD_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name == PLAN_FILE or name.split('-')[0] in ('input', 'output', 'claim'):
+            os.remove(os.path.join(directory, name))
+    parts = [[] for _ in range(shards)]
+    previous = STORE.previous_folder_names(conn)  # Прежние имена для папок, см. YA_DISK.folder_names_of
+    for company in STORE.load_companies(conn):
+        parts[shard_of(company['inn'], shards)].append(dict(company, previous_folder_names=previous.get(company['id'], [])))
+    for shard, companies in enumerate(parts):
+        write_atomic(input_path(directory, shard), companies)
+    with open(os.path.join(directory, PLAN_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'shards': shards, 'stages': stages, 'companies': sum(map(len, parts)),
+                   'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, f, ensure_ascii=False)
+    logging.info(f"Разбиение на части: {shards}, компаний по частям: {', '.join(str(len(p)) for p in parts)}")
+    return [len(part) for part in parts]
+
+
+# Функция проверки, оставлена ли отметка о захвате аварийно завершившимся процессом: процесс на этой же
+# машине уже не работает или отметка не обновлялась дольше STALE_CLAIM_MINUTES (для других машин)
+def claim_is_stale(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            host, pid = f.read().split()[:2]
+        age = time.time() - os.path.getmtime(path)
+    except (OSError, ValueError):
+        return False  # Отметка только что создана или уже удалена другим процессом
+    if host == socket.gethostname():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            pass
+    return age > STALE_CLAIM_MINUTES * 60
+
+
+# Функция снятия отметки о захвате, оставленной аварийно завершившимся процессом (при force - любой).
+# Отметка атомарно переименовывается в файл этого процесса, и устаревшей должна оказаться уже она: между
+# первой проверкой и переименованием другой процесс мог снять старую отметку и создать свою. Свежая отметка
+# возвращается на место. Возвращает True, если отметку снял этот процесс
+def release_claim(path, force=False):
+    if not (force or claim_is_stale(path)):
+        return False
+    private = f'{path}.{socket.gethostname()}-{os.getpid()}.check'
+    try:
+        os.rename(path, private)
+    except FileNotFoundError:
+        return False  # Отметку уже снял другой процесс
+    if force or claim_is_stale(private):
+        os.remove(private)
+        return True
+    try:
+        os.link(private, path)  # В отличие от rename, не заменяет отметку, созданную за это время
+    except FileExistsError:
+        logging.warning(f'{path}: отметка работающего процесса заменена, часть могут обработать два процесса')
+    os.remove(private)
+    return False
+
+
+# Функция захвата части: отметка создаётся атомарно, поэтому одну часть не возьмут два процесса.
+# Без номера захватывается первая свободная часть; возвращает номер части или None.
+# Отметки аварийно завершившихся процессов снимаются; force - снять отметку части shard в любом случае
+def claim(directory, shards, shard=None, force=False):
+    candidates = [shard] if shard is not None else range(shards)
+    for candidate in candidates:
+        if os.path.exists(output_path(directory, candidate)):
+            continue
+        path = claim_path(directory, candidate)
+        if os.path.exists(path) and release_claim(path, force):
+            logging.warning(f'Часть {candidate}: снята прежняя отметка о захвате, часть обрабатывается заново')
+        try:
+            fd = os.open(claim_path(directory, candidate), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(f'{socket.gethostname()} {os.getpid()} {datetime.now():%Y-%m-%d %H:%M:%S}\n')
+        return candidate
+    return None
+
+
+# Обновление времени изменения отметки о захвате раз в HEARTBEAT_SECONDS, пока часть обрабатывается:
+# по нему другие процессы отличают работающий процесс от аварийно завершившегося
+@contextmanager
+def heartbeat(directory, shard):
+    stopped = threading.Event()
+
+    def touch():
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                os.utime(claim_path(directory, shard))
+            except OSError:
+                return
+
+    thread = threading.Thread(target=touch, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+# Функция получения статусов компаний части; возвращает id компании -> (ответ DaData или None, ошибка или None)
+def fetch_statuses(companies, shard, directory, args):
+    dadata = Dadata(args.dadata_token or CHECK_STATUS.token)
+    cache = CHECK_STATUS.DadataCache(os.path.join(directory, f'dadata_cache-{shard}.sqlite'))
+    results = {}
+    missing = []
+    for company in companies:
+        cached = cache.get(company['inn'])
+        if cached is not None:
+            results[company['inn']] = (cached, None)
+        else:
+            missing.append(company['inn'])
+    inns = list(dict.fromkeys(missing))
+    for inn, result, error in CHECK_STATUS.fetch_concurrent(dadata, inns, TokenBucket(args.rps), args.workers):
+        if error is None:
+            cache.put(inn, result)
+        else:
+            logging.error(f'Часть {shard}, ИНН {inn}: не удалось получить данные DaData ({error})')
+        results[inn] = (result, None if error is None else str(error))
+    cache.close()
+    return {company['id']: results[company['inn']] for company in companies}
+
+
+# Функция получения дат из папок компаний части; возвращает имя папки -> (последняя, предпоследняя дата, папка есть)
+def fetch_folders(folder_names, shard, directory, args):
+    token = args.disk_token or YA_DISK.API_TOKEN
+    cache = YA_DISK.FolderCache(os.path.join(directory, f'ya_disk_cache-{shard}.sqlite'))
+    dates = YA_DISK.get_dates_bulk(token, folder_names, args.workers, cache)
+    cache.close()
+    return dates
+
+
+# Функция обработки одной части: результаты записываются в выходной файл части, хранилище не изменяется
+def work(shard, args, directory=SHARD_DIR):
+    current = load_plan(directory)
+    companies = read_jsonl(input_path(directory, shard))
+    started = time.monotonic()
+
+    statuses = {}
+    if 'check_status' in current['stages']:
+        statuses = fetch_statuses(companies, shard, directory, args)
+
+    # Имя папки строится по имени, которое получится после записи статуса (как при слиянии);
+    # нынешнее и прежние имена проверяются, если папку после смены имени не переименовали
+    folder_names = {}
+    for company in companies:
+        result, _ = statuses.get(company['id'], (None, None))
+        names = [company['name_for_folder'], *company.get('previous_folder_names', [])]
+        if result is not None:
+            names.insert(0, NAMES.name_for_folder(CHECK_STATUS.parse_party(result)[1], company['name_gosuslugi']))
+        if names[0] is not None:
+            folder_names[company['id']] = list(dict.fromkeys(NAMES.folder_key(company['number'], name, company['inn'])
+                                                              for name in names if name is not None))
+    dates = {}
+    if 'ya_disk' in current['stages'] and folder_names:
+        dates = fetch_folders(list(dict.fromkeys(name for names in folder_names.values() for name in names)),
+                              shard, directory, args)
+
+    lines = []
+    for company in companies:
+        line = {'company_id': company['id'], 'inn': company['inn']}
+        if company['id'] in statuses:
+            line['status_result'], line['status_error'] = statuses[company['id']]
+        if company['id'] in folder_names and dates:
+            latest, before, exists = YA_DISK.find_folder(dates, folder_names[company['id']], f"ИНН {company['inn']}")
+            line['folder'] = {'exists': exists, 'latest': STORE.date_to_store(latest),
+                              'before': STORE.date_to_store(before)}
+        lines.append(line)
+    write_atomic(output_path(directory, shard), lines)
+    logging.info(f'Часть {shard}: компаний {len(companies)}, за {time.monotonic() - started:.2f} с')
+    return len(companies)
+
+
+# Функция преобразования даты из выходного файла (гггг-мм-дд) в вид, который принимает YA_DISK.apply_dates
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+# Функция слияния результатов всех частей с хранилищем за один проход в порядке id компаний,
+# поэтому результат не зависит от того, в каком порядке и где обрабатывались части
+def merge(conn, directory=SHARD_DIR, partial=False):
+    current = load_plan(directory)
+    ready = [shard for shard in range(current['shards']) if os.path.exists(output_path(directory, shard))]
+    if len(ready) < current['shards'] and not partial:
+        missing = sorted(set(range(current['shards'])) - set(ready))
+        raise RuntimeError(f"Не готовы части: {', '.join(map(str, missing))}")
+    lines = sorted((line for shard in ready for line in read_jsonl(output_path(directory, shard))),
+                   key=lambda line: line['company_id'])
+
+    stats = {'status_changed': 0, 'dates_changed': 0, 'errors': 0}
+    for line in lines:
+        company = STORE.load_company(conn, line['company_id'])
+        if company is None or company['inn'] != line['inn']:
+            continue  # Компания удалена или хранилище пересоздано после разбиения
+        if line.get('status_error'):
+            stats['errors'] += 1
+        elif line.get('status_result') is not None:
+            new_status = CHECK_STATUS.apply_result(conn, company, line['status_result'])
+            stats['status_changed'] += new_status != company['status']
+            company = STORE.load_company(conn, company['id'])
+        folder = line.get('folder')
+        if folder is not None and folder['exists']:
+            stats['dates_changed'] += YA_DISK.apply_dates(conn, company, parse_date(folder['latest']),
+                                                          parse_date(folder['before']), 'Shards')
+    conn.commit()
+    logging.info(f"Слияние частей {len(ready)} из {current['shards']}: строк {len(lines)}, "
+                 f"сменился статус {stats['status_changed']}, изменились даты {stats['dates_changed']}, "
+                 f"ошибок DaData {stats['errors']}")
+    return stats
+
+
+# Точка входа дочернего процесса при локальном запуске: захват и обработка свободных частей, пока они есть
+# index - номер процесса, processes - количество процессов на этой машине
+def run_worker(args, directory, tokens, index=0, processes=1):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler('changes.log', mode='a'), logging.StreamHandler()])
+    current = load_plan(directory)
+    # Ограничение --rps действует на всю машину (лимит DaData - на IP) и делится между её процессами
+    args.rps = args.rps / processes
+    # Каждому процессу - свой токен из списка (по кругу), чтобы квоты API расходовались раздельно
+    args.dadata_token = tokens['dadata'][index % len(tokens['dadata'])] if tokens['dadata'] else None
+    args.disk_token = tokens['disk'][index % len(tokens['disk'])] if tokens['disk'] else None
+    while (shard := claim(directory, current['shards'])) is not None:
+        with METRICS.stage(f'shard_{shard}'), heartbeat(directory, shard):
+            work(shard, args, directory)
+    METRICS.append_summary(pid=os.getpid())
+
+
+# Функция локального запуска: разбиение, обработка частей несколькими процессами и слияние
+def run(conn, args):
+    plan(conn, args.shards, args.stages, args.dir)
+    tokens = {'dadata': [token for token in args.dadata_tokens.split(',') if token],
+              'disk': [token for token in args.disk_tokens.split(',') if token]}
+    context = multiprocessing.get_context('spawn')
+    count = min(args.processes or args.shards, args.shards)
+    for service, values in tokens.items():
+        if 1 < len(values) < count:
+            logging.warning(f'Токенов {service} {len(values)} на {count} процессов: некоторые процессы делят токен')
+    processes = [context.Process(target=run_worker, args=(args, args.dir, tokens, index, count))
+                 for index in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return merge(conn, args.dir)
+
+
+# Функция для разбора аргументов командной строки
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка статусов и папок компаний по частям в нескольких процессах')
+    parser.add_argument('command', choices=['plan', 'work', 'merge', 'run'],
+                        help='plan - разбиение, work - обработка части, merge - слияние, run - всё сразу на этой машине')
+    parser.add_argument('--dir', default=SHARD_DIR, help='Папка координации (может быть общей для нескольких машин)')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help='Количество частей')
+    parser.add_argument('--stages', default=','.join(SHARD_STAGES), help='Этапы через запятую')
+    parser.add_argument('--shard', type=int, help='Номер части для work (по умолчанию - первая свободная)')
+    parser.add_argument('--processes', type=int, help='Количество процессов для run (по умолчанию - по числу частей)')
+    parser.add_argument('--workers', type=int, default=CHECK_STATUS.DEFAULT_WORKERS,
+                        help='Число одновременных запросов в одном процессе')
+    parser.add_argument('--rps', type=float, default=CHECK_STATUS.DEFAULT_RPS,
+                        help='Допустимое число запросов к DaData в секунду со всей машины '
+                             '(run делит его между процессами)')
+    parser.add_argument('--dadata-token', help='Токен DaData для work (по умолчанию - CHECK_STATUS.token)')
+    parser.add_argument('--disk-token', help='Токен Яндекс.Диска для work (по умолчанию - YA_DISK.API_TOKEN)')
+    parser.add_argument('--dadata-tokens', default='', help='Токены DaData для run через запятую, по кругу на части')
+    parser.add_argument('--disk-tokens', default='', help='Токены Яндекс.Диска для run через запятую')
+    parser.add_argument('--partial', action='store_true', help='merge: слить готовые части, не дожидаясь остальных')
+    parser.add_argument('--force', action='store_true',
+                        help='work: снять отметку о захвате части --shard, даже если она не устарела')
+    args = parser.parse_args(argv)
+    if args.force and args.shard is None:
+        parser.error('--force используется вместе с --shard')
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(args.stages) - set(SHARD_STAGES)
+    if unknown:
+        parser.error(f'Неизвестные этапы: {", ".join(sorted(unknown))}')
+    return args
+
+
+# Основная функция
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'work':
+        # Обработка части не требует доступа к хранилищу: нужна только папка координации
+        shard = claim(args.dir, load_plan(args.dir)['shards'], args.shard, args.force)
+        if shard is None:
+            logging.info('Свободных частей нет')
+            return
+        with METRICS.stage(f'shard_{shard}'), heartbeat(args.dir, shard):
+            work(shard, args, args.dir)
+        METRICS.append_summary(shard=shard)
+        return
+    conn = STORE.connect()
+    try:
+        if args.command == 'plan':
+            plan(conn, args.shards, args.stages, args.dir)
+        elif args.command == 'merge':
+            merge(conn, args.dir, args.partial)
+        else:
+            run(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    # Настройка логирования: журнал дописывается в changes.log и выводится в консоль
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    main()
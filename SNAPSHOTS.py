@@ -0,0 +1,237 @@
+import sqlite3  # Снимки хранятся в отдельной базе SQLite
+import hashlib  # Адресация строк и снимков по хешу содержимого
+import json  # Каноническое представление строки
+import zlib  # Сжатие строк
+import os  # Работа с файлами
+import sys  # Аргументы командной строки
+import time  # Время снимка
+import logging  # Ведение журнала
+from datetime import datetime  # Разбор времени и границы периодов хранения
+import pandas as pd  # Проверка пропущенных значений
+import STORE  # Хранилище данных о компаниях
+
+SNAPSHOTS_PATH = 'snapshots.sqlite'  # Файл хранилища снимков
+BACKUP_NAME_FORMAT = '%d-%m-%Y %H-%M-%S'  # Формат имени файлов прежних резервных копий в папке backup
+VOLATILE_FIELDS = ('checked_at',)  # Поля, изменение которых само по себе не создаёт новую версию строки
+
+# Политика хранения: самый новый снимок в каждом из последних N часов, дней и месяцев
+KEEP_HOURLY = 48
+KEEP_DAILY = 30
+KEEP_MONTHLY = 24
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,           -- SHA-256 строки в каноническом JSON
+    data BLOB NOT NULL               -- Строка в JSON, сжатая zlib
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken_at REAL NOT NULL,          -- Время снимка (Unix time)
+    hash TEXT NOT NULL,              -- Хеш содержимого всего снимка
+    rows INTEGER NOT NULL            -- Количество компаний в снимке
+);
+CREATE INDEX IF NOT EXISTS snapshots_taken_at ON snapshots (taken_at);
+CREATE TABLE IF NOT EXISTS deltas (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    company_id INTEGER NOT NULL,     -- Идентификатор компании в хранилище
+    inn TEXT NOT NULL,
+    blob_hash TEXT,                  -- Новая версия строки; NULL - компания удалена
+    content_hash TEXT,               -- Хеш строки без VOLATILE_FIELDS
+    PRIMARY KEY (company_id, snapshot_id)
+);
+CREATE INDEX IF NOT EXISTS deltas_inn ON deltas (inn, snapshot_id);
+CREATE INDEX IF NOT EXISTS deltas_snapshot ON deltas (snapshot_id);
+"""
+
+
+# Функция открытия хранилища снимков
+def connect(path=SNAPSHOTS_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# Функция преобразования значения в тип, поддерживаемый JSON (типы numpy и pandas - в обычные)
+def plain(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value if isinstance(value, (str, int, float)) else str(value)
+
+
+# Функция хеширования строки в каноническом JSON; возвращает (хеш, JSON)
+def digest(row):
+    text = json.dumps(row, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest(), text
+
+
+# Функция чтения текущего (на момент снимка snapshot_id) состояния: company_id -> строка deltas
+def state(conn, snapshot_id=None):
+    query = 'SELECT company_id, inn, blob_hash, content_hash, MAX(snapshot_id) FROM deltas'
+    if snapshot_id is not None:
+        query += ' WHERE snapshot_id <= ?'
+    rows = conn.execute(query + ' GROUP BY company_id', () if snapshot_id is None else (snapshot_id,))
+    return {row['company_id']: row for row in rows if row['blob_hash'] is not None}
+
+
+# Функция создания снимка; сохраняются только строки, изменившиеся с прошлого снимка.
+# Возвращает (id снимка, создан ли новый снимок); если ничего не изменилось, возвращается прежний снимок
+def take_snapshot(conn, companies, taken_at=None):
+    taken_at = taken_at or time.time()
+    previous = state(conn)
+    blobs = []
+    deltas = []
+    current = {}
+    for company in companies:
+        row = {field: plain(company[field]) for field in company.keys() if field != 'id'}
+        blob_hash, text = digest(row)
+        content_hash, _ = digest({field: value for field, value in row.items() if field not in VOLATILE_FIELDS})
+        current[company['id']] = content_hash
+        old = previous.get(company['id'])
+        if old is None or old['content_hash'] != content_hash:
+            blobs.append((blob_hash, zlib.compress(text.encode('utf-8'), 9)))
+            deltas.append((company['id'], str(row['inn']), blob_hash, content_hash))
+    # Компании, которых больше нет в хранилище
+    for company_id, old in previous.items():
+        if company_id not in current:
+            deltas.append((company_id, old['inn'], None, None))
+
+    last = conn.execute('SELECT id FROM snapshots ORDER BY id DESC LIMIT 1').fetchone()
+    if not deltas and last is not None:
+        logging.info(f'Снимок не создан: данные не изменились с последнего снимка {last["id"]}')
+        return last['id'], False
+
+    snapshot_hash = hashlib.sha256(''.join(f'{company_id}:{content_hash};' for company_id, content_hash
+                                           in sorted(current.items())).encode('utf-8')).hexdigest()
+    snapshot_id = conn.execute('INSERT INTO snapshots (taken_at, hash, rows) VALUES (?, ?, ?)',
+                               (taken_at, snapshot_hash, len(current))).lastrowid
+    conn.executemany('INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)', blobs)
+    conn.executemany('INSERT INTO deltas (snapshot_id, company_id, inn, blob_hash, content_hash) '
+                     'VALUES (?, ?, ?, ?, ?)', [(snapshot_id, *delta) for delta in deltas])
+    conn.commit()
+    logging.info(f'Снимок {snapshot_id}: компаний {len(current)}, изменённых строк {len(deltas)}')
+    return snapshot_id, True
+
+
+# Функция чтения строки по хешу
+def load_blob(conn, blob_hash):
+    data = conn.execute('SELECT data FROM blobs WHERE hash = ?', (blob_hash,)).fetchone()[0]
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+# Функция поиска последнего снимка, сделанного не позже указанного времени
+def snapshot_at(conn, at):
+    return conn.execute('SELECT * FROM snapshots WHERE taken_at <= ? ORDER BY taken_at DESC, id DESC LIMIT 1',
+                        (at,)).fetchone()
+
+
+# Функция восстановления данных на указанное время: список строк companies в порядке id
+def restore(conn, at):
+    snapshot = snapshot_at(conn, at)
+    if snapshot is None:
+        return []
+    rows = []
+    for company_id, delta in sorted(state(conn, snapshot['id']).items()):
+        rows.append({'id': company_id, **load_blob(conn, delta['blob_hash'])})
+    return rows
+
+
+# Функция истории компании по ИНН: список (время снимка, строка или None, если компания удалена)
+def history(conn, inn):
+    rows = conn.execute('SELECT s.taken_at, d.blob_hash FROM deltas d JOIN snapshots s ON s.id = d.snapshot_id '
+                        'WHERE d.inn = ? ORDER BY s.taken_at, s.id', (str(inn),)).fetchall()
+    return [(row['taken_at'], load_blob(conn, row['blob_hash']) if row['blob_hash'] else None) for row in rows]
+
+
+# Функция выбора снимков, сохраняемых политикой хранения: самый новый в каждом из последних периодов
+def retained(snapshots, hourly=KEEP_HOURLY, daily=KEEP_DAILY, monthly=KEEP_MONTHLY):
+    keep = {snapshots[-1]['id']} if snapshots else set()  # Последний снимок сохраняется всегда
+    for period_format, count in (('%Y-%m-%d %H', hourly), ('%Y-%m-%d', daily), ('%Y-%m', monthly)):
+        periods = {}
+        for snapshot in snapshots:  # Снимки упорядочены по времени: в периоде остаётся самый новый
+            periods[datetime.fromtimestamp(snapshot['taken_at']).strftime(period_format)] = snapshot['id']
+        keep.update(snapshot_id for _, snapshot_id in sorted(periods.items())[-count:])
+    return keep
+
+
+# Функция удаления снимков по политике хранения. Изменения удаляемого снимка переносятся в следующий,
+# поэтому более поздние снимки восстанавливаются без изменений
+def prune(conn, hourly=KEEP_HOURLY, daily=KEEP_DAILY, monthly=KEEP_MONTHLY):
+    snapshots = conn.execute('SELECT id, taken_at FROM snapshots ORDER BY taken_at, id').fetchall()
+    keep = retained(snapshots, hourly, daily, monthly)
+    removed = 0
+    for snapshot, following in zip(snapshots, snapshots[1:]):
+        if snapshot['id'] in keep:
+            continue
+        # Если у компании есть более новая версия в следующем снимке, старая просто удаляется
+        conn.execute('UPDATE OR IGNORE deltas SET snapshot_id = ? WHERE snapshot_id = ?',
+                     (following['id'], snapshot['id']))
+        conn.execute('DELETE FROM deltas WHERE snapshot_id = ?', (snapshot['id'],))
+        conn.execute('DELETE FROM snapshots WHERE id = ?', (snapshot['id'],))
+        removed += 1
+    if removed:
+        conn.execute('DELETE FROM blobs WHERE hash NOT IN (SELECT blob_hash FROM deltas WHERE blob_hash IS NOT NULL)')
+        logging.info(f'Удалено снимков по политике хранения: {removed}')
+    conn.commit()
+    return removed
+
+
+# Функция переноса прежних резервных копий Excel из папки backup (имя файла - время копии).
+# Номер строки в файле соответствует id компании в хранилище (компании только добавляются в конец).
+# Копии не новее последнего снимка пропускаются
+def import_backups(conn, directory='backup'):
+    files = []
+    for name in os.listdir(directory):
+        try:
+            files.append((datetime.strptime(os.path.splitext(name)[0], BACKUP_NAME_FORMAT), name))
+        except ValueError:
+            continue
+    latest = conn.execute('SELECT MAX(taken_at) FROM snapshots').fetchone()[0] or 0
+    files = [(taken_at, name) for taken_at, name in sorted(files) if taken_at.timestamp() > latest]
+    for taken_at, name in files:
+        rows = STORE.read_excel_rows(os.path.join(directory, name))
+        companies = [{'id': i, **row} for i, row in enumerate(rows, start=1)]
+        take_snapshot(conn, companies, taken_at.timestamp())
+    return len(files)
+
+
+# Функция разбора времени из командной строки ("2023-11-02 15:30" или "2023-11-02")
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp() if value else time.time()
+
+
+# Запуск из командной строки:
+#   python SNAPSHOTS.py take | list | prune | history ИНН | restore ВРЕМЯ [файл.xlsx] | import-backups [папка]
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    connection = connect()
+    if command == 'take':
+        store = STORE.connect()
+        take_snapshot(connection, STORE.load_companies(store))
+        store.close()
+    elif command == 'prune':
+        prune(connection)
+    elif command == 'history':
+        for moment, row in history(connection, sys.argv[2]):
+            when = datetime.fromtimestamp(moment).strftime('%Y-%m-%d %H:%M:%S')
+            if row is None:
+                print(f'{when}  удалена')
+            else:
+                print(f"{when}  {row['status']}  {row['last_date'] or ''}  {row['name_gosuslugi']}")
+    elif command == 'restore':
+        file_name = sys.argv[3] if len(sys.argv) > 3 else 'restored.xlsx'
+        rows = restore(connection, parse_time(sys.argv[2]))
+        STORE.write_companies(rows, file_name)
+        print(f'Восстановлено компаний: {len(rows)} -> {file_name}')
+    elif command == 'import-backups':
+        print(f"Перенесено резервных копий: {import_backups(connection, sys.argv[2] if len(sys.argv) > 2 else 'backup')}")
+    else:
+        for snapshot in connection.execute('SELECT s.*, COUNT(d.company_id) AS changed FROM snapshots s '
+                                           'LEFT JOIN deltas d ON d.snapshot_id = s.id GROUP BY s.id ORDER BY s.taken_at'):
+            when = datetime.fromtimestamp(snapshot['taken_at']).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{snapshot['id']:>5}  {when}  компаний {snapshot['rows']}  изменённых строк {snapshot['changed']}")
+    connection.close()
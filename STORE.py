@@ -0,0 +1,298 @@
+import sqlite3  # Встроенная база данных SQLite - основное хранилище данных о компаниях
+import json  # Значения полей в событиях ленты изменений
+import os  # Работа с файлами
+import sys  # Аргументы командной строки
+from datetime import datetime  # Работа с датами и временем
+import pandas as pd  # Обмен данными со скриптами в виде DataFrame
+import METRICS  # Замеры времени чтения и записи Excel
+import WORKBOOK  # Потоковое чтение и запись Excel
+
+STORE_PATH = 'companies.sqlite'  # Файл хранилища
+EXCEL_PATH = 'companies.xlsx'  # Выгрузка в Excel, формируемая из хранилища
+ABSENT = 'Отсутствует'  # Значение даты в Excel, если папка есть, но дат в ней нет
+
+# Соответствие столбцов Excel и полей таблицы companies (в порядке столбцов листа)
+EXCEL_COLUMNS = {
+    '№': 'number',
+    'NAME_GOSUSLUGI': 'name_gosuslugi',
+    'INN': 'inn',
+    'STATUS': 'status',
+    'DATE/TIME': 'checked_at',
+    'COLOR': 'color',
+    'SHORT_NAME_DADATA': 'short_name',
+    'FULL_NAME_DADATA': 'full_name',
+    'NAME_FOR_FOLDER': 'name_for_folder',
+    'LAST_DATE': 'last_date',
+    'BEFORE_LAST_DATE': 'before_last_date',
+    'LAST_DATE.1': 'last_date_1',
+    'URL': 'url',
+}
+DATE_FIELDS = ('last_date', 'before_last_date')  # Поля с датами из папок Яндекс.Диска
+REQUIRED_COLUMNS = ('№', 'NAME_GOSUSLUGI', 'INN')  # Столбцы, без которых Excel-файл не переносится в хранилище
+# Цветовая маркировка выгрузки: (первый столбец, последний столбец, формула, формат).
+# Правило для недействующих компаний идёт первым и имеет приоритет над зелёным
+EXCEL_RULES = [
+    ('№', 'LAST_DATE', '=${STATUS}2<>"Действующая"', {'bg_color': '#FF0000'}),
+    ('№', 'URL', '=${COLOR}2="NEW"', {'bg_color': '#00FF00'}),
+]
+
+# Виды событий ленты изменений
+COMPANY_ADDED = 'company_added'  # Новая компания в списке ИПР
+STATUS_CHANGED = 'status_changed'  # Смена статуса по данным DaData
+NAME_CHANGED = 'name_changed'  # Смена имени для папки (NAME_FOR_FOLDER)
+DATES_CHANGED = 'dates_changed'  # Смена дат в папке на Яндекс.Диске
+URL_CHANGED = 'url_changed'  # Смена ссылки, заполненной в Google-таблице
+CHANGE_TYPES = (COMPANY_ADDED, STATUS_CHANGED, NAME_CHANGED, DATES_CHANGED, URL_CHANGED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    id INTEGER PRIMARY KEY,          -- Порядок строк в выгрузке
+    number INTEGER,                  -- Номер компании (столбец №)
+    name_gosuslugi TEXT,
+    inn TEXT NOT NULL,
+    status TEXT,
+    checked_at TIMESTAMP,            -- Время последней проверки статуса
+    color TEXT,                      -- 'NEW' для компаний, добавленных последним запуском
+    short_name TEXT,
+    full_name TEXT,
+    name_for_folder TEXT,
+    last_date DATE,                  -- Последняя дата из папки на Яндекс.Диске (NULL - дат нет)
+    before_last_date DATE,           -- Предпоследняя дата
+    folder_found INTEGER,            -- 1 - папка найдена, NULL - ещё не проверялась
+    last_date_1 TEXT,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS companies_inn ON companies (inn);
+CREATE TABLE IF NOT EXISTS status_history (
+    id INTEGER PRIMARY KEY,
+    company_id INTEGER NOT NULL REFERENCES companies (id),
+    inn TEXT NOT NULL,
+    old_status TEXT,
+    new_status TEXT,
+    changed_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS status_history_inn ON status_history (inn);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- Порядковый номер события (только растёт)
+    type TEXT NOT NULL,              -- Вид события, см. CHANGE_TYPES
+    company_id INTEGER NOT NULL REFERENCES companies (id),
+    inn TEXT NOT NULL,
+    old TEXT,                        -- Прежние значения полей (JSON)
+    new TEXT,                        -- Новые значения полей (JSON)
+    created_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS offsets (
+    consumer TEXT PRIMARY KEY,       -- Этап, читающий ленту изменений
+    seq INTEGER NOT NULL,            -- Последнее обработанное событие
+    committed_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schedule (
+    company_id INTEGER NOT NULL REFERENCES companies (id),
+    check_type TEXT NOT NULL,        -- 'status' (DaData) или 'folder' (Яндекс.Диск)
+    due_at REAL NOT NULL,            -- Время следующей проверки (Unix time)
+    interval_hours REAL NOT NULL,    -- Текущий интервал между проверками
+    checked_at REAL,                 -- Время последней проверки
+    PRIMARY KEY (company_id, check_type)
+);
+"""
+
+
+# Функция открытия хранилища; при первом запуске данные переносятся из companies.xlsx
+def connect(path=STORE_PATH, excel_path=EXCEL_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row  # Доступ к полям строки по имени
+    conn.execute('PRAGMA journal_mode=WAL')  # Чтение не блокируется записью из других скриптов
+    conn.executescript(SCHEMA)
+    empty = conn.execute('SELECT COUNT(*) FROM companies').fetchone()[0] == 0
+    if empty and excel_path and os.path.exists(excel_path):
+        import_excel(conn, excel_path)
+    return conn
+
+
+# Функция преобразования даты из вида Excel (дд.мм.гггг) в вид хранилища (гггг-мм-дд)
+def date_to_store(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if pd.isna(value) or value == ABSENT:
+        return None
+    return datetime.strptime(str(value), '%d.%m.%Y').strftime('%Y-%m-%d')
+
+
+# Функция преобразования даты из вида хранилища в вид Excel
+def date_from_store(value, folder_found):
+    if value is not None:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%d.%m.%Y')
+    return ABSENT if folder_found else None
+
+
+# Функция преобразования строки DataFrame (с заголовками Excel) в поля таблицы companies
+def row_to_fields(row):
+    fields = {}
+    for column, field in EXCEL_COLUMNS.items():
+        value = row.get(column)
+        fields[field] = None if value is None or pd.isna(value) else value
+    fields['number'] = int(fields['number']) if fields['number'] is not None else None
+    # ИНН, сохранённый в Excel числом, читается как int или float
+    inn = fields['inn']
+    fields['inn'] = str(int(inn)) if isinstance(inn, float) and inn.is_integer() else str(inn)
+    # Папка считается проверенной, если в столбце дат уже есть значение
+    fields['folder_found'] = 1 if fields['last_date'] is not None else None
+    for field in DATE_FIELDS:
+        fields[field] = date_to_store(fields[field])
+    return fields
+
+
+# Функция потокового чтения Excel-файла: по одной строке в виде полей таблицы companies
+def read_excel_rows(path=EXCEL_PATH):
+    for record in WORKBOOK.iter_records(path, REQUIRED_COLUMNS):
+        yield row_to_fields(record)
+
+
+# Функция переноса данных из Excel в хранилище; файл читается построчно, без загрузки в DataFrame
+@METRICS.timed('excel.read')
+def import_excel(conn, path=EXCEL_PATH):
+    add_rows(conn, read_excel_rows(path))
+    conn.commit()
+
+
+# Функция добавления компаний из DataFrame с заголовками Excel
+def add_companies(conn, df):
+    add_rows(conn, (row_to_fields(row) for row in df.to_dict('records')))
+
+
+# Функция добавления компаний (полей таблицы companies) по мере их получения;
+# о каждой компании пишется событие в ленту
+def add_rows(conn, rows):
+    statement = None
+    for row in rows:
+        if statement is None:
+            fields = list(row)
+            statement = f"INSERT INTO companies ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        cursor = conn.execute(statement, tuple(row[field] for field in fields))
+        record_change(conn, COMPANY_ADDED, cursor.lastrowid, row['inn'], None,
+                      {'number': row['number'], 'name_gosuslugi': row['name_gosuslugi']})
+
+
+# Функция чтения всех компаний в порядке строк
+def load_companies(conn):
+    return conn.execute('SELECT * FROM companies ORDER BY id').fetchall()
+
+
+# Функция чтения одной компании по идентификатору
+def load_company(conn, company_id):
+    return conn.execute('SELECT * FROM companies WHERE id = ?', (company_id,)).fetchone()
+
+
+# Функция чтения всех компаний в DataFrame с заголовками Excel
+@METRICS.timed('store.load_dataframe')
+def load_dataframe(conn):
+    return companies_to_dataframe(load_companies(conn))
+
+
+# Функция преобразования строки таблицы companies (или словаря с теми же полями) в значения столбцов Excel
+def excel_values(company):
+    return [date_from_store(company[field], company['folder_found']) if field in DATE_FIELDS else company[field]
+            for field in EXCEL_COLUMNS.values()]
+
+
+# Функция преобразования строк таблицы companies (или словарей с теми же полями) в DataFrame с заголовками Excel
+def companies_to_dataframe(companies):
+    return pd.DataFrame([excel_values(company) for company in companies], columns=list(EXCEL_COLUMNS))
+
+
+# Функция обновления отдельных полей одной компании
+def update_company(conn, company_id, **fields):
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+    conn.execute(f'UPDATE companies SET {assignments} WHERE id = ?', (*fields.values(), company_id))
+
+
+# Функция записи смены статуса компании в историю
+def record_status_change(conn, company_id, inn, old_status, new_status, changed_at=None):
+    changed_at = changed_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute('INSERT INTO status_history (company_id, inn, old_status, new_status, changed_at) '
+                 'VALUES (?, ?, ?, ?, ?)', (company_id, inn, old_status, new_status, changed_at))
+
+
+# Функция добавления события в ленту изменений
+def record_change(conn, change_type, company_id, inn, old, new):
+    conn.execute('INSERT INTO changes (type, company_id, inn, old, new, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                 (change_type, company_id, str(inn), json.dumps(old, ensure_ascii=False),
+                  json.dumps(new, ensure_ascii=False), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+# Функция получения прежних имён для папки (NAME_FOR_FOLDER) по событиям name_changed:
+# id компании -> список имён, начиная с последнего. По ним находятся папки, которые не переименовали
+def previous_folder_names(conn, company_id=None):
+    query = 'SELECT company_id, old FROM changes WHERE type = ?'
+    params = (NAME_CHANGED,)
+    if company_id is not None:
+        query += ' AND company_id = ?'
+        params += (company_id,)
+    names = {}
+    for row in conn.execute(query + ' ORDER BY seq DESC', params):
+        name = json.loads(row['old'] or '{}').get('name_for_folder')
+        if name is not None and name not in names.get(row['company_id'], []):
+            names.setdefault(row['company_id'], []).append(name)
+    return names
+
+
+# Функция чтения сохранённой позиции этапа consumer в ленте: строка offsets или None
+def read_offset(conn, consumer):
+    return conn.execute('SELECT * FROM offsets WHERE consumer = ?', (consumer,)).fetchone()
+
+
+# Функция чтения событий после последнего обработанного этапом consumer.
+# Возвращает (номер последнего обработанного события или None, если этап ещё не читал ленту, список событий)
+def read_changes(conn, consumer):
+    row = read_offset(conn, consumer)
+    offset = row['seq'] if row is not None else None
+    changes = conn.execute('SELECT * FROM changes WHERE seq > ? ORDER BY seq', (offset or 0,)).fetchall()
+    return offset, changes
+
+
+# Функция сохранения номера последнего обработанного этапом события
+def commit_offset(conn, consumer, seq):
+    conn.execute('INSERT OR REPLACE INTO offsets (consumer, seq, committed_at) VALUES (?, ?, ?)',
+                 (consumer, seq, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+# Функция снятия отметки 'NEW' у компаний с указанными ИНН
+def clear_color(conn, inns):
+    conn.executemany('UPDATE companies SET color = NULL WHERE inn = ? AND color IS NOT NULL',
+                     [(str(inn),) for inn in inns])
+
+
+# Функция записи DataFrame с заголовками Excel в файл с учетом цветовой маркировки
+@METRICS.timed('excel.write')
+def write_excel(companies, file_name=EXCEL_PATH):
+    WORKBOOK.write_records(file_name, list(companies.columns), companies.itertuples(index=False, name=None),
+                           EXCEL_RULES)
+
+
+# Функция записи строк таблицы companies (или словарей с теми же полями) в Excel за один проход
+@METRICS.timed('excel.write')
+def write_companies(companies, file_name=EXCEL_PATH):
+    WORKBOOK.write_records(file_name, list(EXCEL_COLUMNS), map(excel_values, companies), EXCEL_RULES)
+
+
+# Функция выгрузки хранилища в файл Excel: строки читаются из базы и записываются по одной
+def export_excel(conn, file_name=EXCEL_PATH):
+    write_companies(conn.execute('SELECT * FROM companies ORDER BY id'), file_name)
+
+
+# Запуск из командной строки: python STORE.py export|import [файл.xlsx]
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    path = sys.argv[2] if len(sys.argv) > 2 else EXCEL_PATH
+    connection = connect(excel_path=None if command == 'import' else EXCEL_PATH)
+    if command == 'import':
+        # Перенос только в пустое хранилище: иначе каждая компания добавилась бы второй раз
+        count = connection.execute('SELECT COUNT(*) FROM companies').fetchone()[0]
+        if count:
+            connection.close()
+            sys.exit(f'В хранилище {STORE_PATH} уже есть компании ({count}), перенос из {path} не выполнен. '
+                     f'Для повторного переноса удалите или переименуйте {STORE_PATH}')
+        import_excel(connection, path)
+    else:
+        export_excel(connection, path)
+    connection.close()
@@ -0,0 +1,71 @@
+import openpyxl  # Потоковое чтение xlsx (режим read_only)
+import xlsxwriter  # Потоковая запись xlsx (режим constant_memory)
+from xlsxwriter.utility import xl_col_to_name  # Буквенное обозначение столбца Excel по номеру
+
+SHEET_NAME = 'Sheet1'  # Имя листа, как при записи через pandas
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'  # Формат ячеек с датой и временем, как при записи через pandas
+
+
+# Функция построения соответствия названия столбца и его номера по строке заголовков
+def header_map(header):
+    return {name: index for index, name in enumerate(header) if name is not None}
+
+
+# Функция получения номера столбца по его названию (вместо букв и номеров, записанных в коде)
+def column_index(columns, name):
+    if name not in columns:
+        raise ValueError(f'В таблице нет столбца {name}')
+    return columns[name]
+
+
+# Функция получения буквы столбца по его названию
+def column_letter(columns, name):
+    return xl_col_to_name(column_index(columns, name))
+
+
+# Функция потокового чтения листа: строки читаются по одной и возвращаются словарями
+# {название столбца: значение}. Лист целиком в память не загружается; пустые строки пропускаются.
+# required - столбцы, без которых файл не может быть прочитан
+def iter_records(path, required=()):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = header_map(next(rows, ()))
+        missing = [name for name in required if name not in columns]
+        if missing:
+            raise ValueError(f"В файле {path} нет столбцов: {', '.join(missing)}")
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield {name: values[index] if index < len(values) else None for name, index in columns.items()}
+    finally:
+        workbook.close()
+
+
+# Функция потоковой записи листа за один проход: строки записываются по мере получения и сразу
+# выгружаются на диск, поэтому память не зависит от размера таблицы.
+# rows - последовательности значений в порядке header. rules - правила условного форматирования
+# (первый столбец, последний столбец, формула, формат); в формуле вместо букв столбцов указываются
+# их названия: '=${STATUS}2<>"Действующая"'. Возвращает количество записанных строк
+def write_records(path, header, rows, rules=()):
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'default_date_format': DATETIME_FORMAT})
+    try:
+        worksheet = workbook.add_worksheet(SHEET_NAME)
+        bold = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        worksheet.write_row(0, 0, header, bold)
+        count = 0
+        for count, values in enumerate(rows, start=1):
+            # Пропуски (NaN, NaT) записываются пустыми ячейками
+            worksheet.write_row(count, 0, [None if value != value else value for value in values])
+
+        columns = header_map(header)
+        letters = {name: xl_col_to_name(index) for name, index in columns.items()}
+        if count:
+            # Правила применяются к диапазону целиком; правило, добавленное раньше, имеет приоритет
+            for first, last, formula, cell_format in rules:
+                worksheet.conditional_format(1, column_index(columns, first), count, column_index(columns, last), {
+                    'type': 'formula', 'criteria': formula.format(**letters),
+                    'format': workbook.add_format(cell_format)})
+    finally:
+        workbook.close()
+    return count
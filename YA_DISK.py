@@ -1,39 +1,58 @@
-import requests  # Импорт модуля для отправки HTTP-запросов
-import openpyxl  # Импорт модуля для работы с файлами Excel формата .xlsx
+from HTTP_CLIENT import HttpClient  # Общий HTTP-клиент с пулом соединений и повторами
+import STORE  # Хранилище данных о компаниях
+import METRICS  # Замеры времени вызовов и этапов
+import NAMES  # Имя папки компании на Яндекс.Диске
 from datetime import datetime  # Импорт класса datetime для работы с датами и временем
 import logging  # Импорт модуля для логирования
+import argparse  # Импорт модуля для разбора аргументов командной строки
+import sqlite3  # Импорт модуля для работы с локальной базой SQLite (кэш метаданных папок)
 
-# Настройка логирования для записи в файл 'changes.log' с уровнем важности INFO и определённым форматом сообщений
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler('changes.log', mode='w'),  # Логи будут записываться в файл changes.log
-                        logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
-                    ]
-                )
 
 API_TOKEN = ""  # Токен для доступа к API Яндекс.Диска
 BASE_URL = "https://cloud-api.yandex.net/v1/disk/resources"  # Базовый URL для обращения к API Яндекс.Диска
+PARENT_PATH = "disk:/ИПР"  # Папка, в которой лежат папки всех компаний
+PAGE_LIMIT = 1000  # Количество элементов папки, запрашиваемых за один раз
+DEFAULT_WORKERS = 8  # Число одновременных запросов к API Яндекс.Диска
+CACHE_PATH = "ya_disk_cache.sqlite"  # Файл кэша метаданных папок компаний
+
+client = HttpClient(pool_size=DEFAULT_WORKERS)  # Общий клиент: соединения переиспользуются между папками
+
 
 # Функция для получения содержимого папки на Яндекс.Диске
-def get_folder_content(url, token):
+def get_folder_content(url, token, params=None):
     headers = {"Authorization": f"OAuth {token}"}  # Заголовок для авторизации запроса с использованием токена
-    response = requests.get(url, headers=headers)  # Отправка GET-запроса для получения содержимого папки
+    with METRICS.timed('yandex.get_folder_content'):
+        response = client.get(url, headers=headers, params=params)  # Отправка GET-запроса для получения содержимого папки
     return response.json()  # Возврат ответа в формате JSON
 
-# Функция для получения дат из имен папок на Яндекс.Диске
-def get_dates_from_folder(token, folder_path):
-    url = f"{BASE_URL}?path={folder_path}"  # Формирование URL для запроса содержимого папки
-    folder_content = get_folder_content(url, token)  # Получение содержимого папки
 
-    if 'error' in folder_content:
-        return None, None, False  # Возврат значений None, если в ответе есть ошибка
+# Функция для постраничного получения всех элементов папки, запрашиваются только указанные поля
+def list_folder_items(token, folder_path, fields=("name", "type")):
+    items = []  # Список всех элементов папки
+    offset = 0  # Смещение для постраничного запроса
+    while True:
+        params = {
+            "path": folder_path,
+            "limit": PAGE_LIMIT,
+            "offset": offset,
+            # Проекция ответа: только нужные поля элементов и их общее количество
+            "fields": ",".join([f"_embedded.items.{field}" for field in fields] + ["_embedded.total"]),
+        }
+        folder_content = get_folder_content(BASE_URL, token, params)
+        if 'error' in folder_content:
+            return None  # Папка не существует или недоступна
+        embedded = folder_content.get('_embedded', {})
+        page = embedded.get('items', [])
+        items.extend(page)
+        offset += len(page)
+        if not page or offset >= embedded.get('total', 0):
+            return items
 
-    if '_embedded' not in folder_content:
-        return None, None, True  # Возврат значений None, если в ответе нет ключа '_embedded'
 
+# Функция для получения последней и предпоследней даты из имён вложенных папок
+def latest_dates(items):
     all_dates = []  # Список для хранения всех дат
-    for item in folder_content['_embedded']['items']:  # Перебор всех элементов в папке
+    for item in items:  # Перебор всех элементов в папке
         if item['type'] == 'dir':  # Если элемент является папкой
             try:
                 date_str = item['name'].split(" на")[0]  # Попытка извлечь дату из имени папки
@@ -45,56 +64,218 @@ def get_dates_from_folder(token, folder_path):
 
     all_dates.sort(reverse=True)  # Сортировка дат в обратном порядке (от новых к старым)
     # Возврат самой последней и предпоследней даты, если они есть
-    return all_dates[0] if all_dates else 'Отсутствует', all_dates[1] if len(all_dates) > 1 else 'Отсутствует', True
-
-# Загрузка книги Excel и выбор активного листа
-wb = openpyxl.load_workbook("companies.xlsx")
-sheet = wb.active
-
-changed_rows = []  # Список для отслеживания изменённых строк
-
-# Перебор строк в таблице, начиная со второй строки и до последней
-for row_num, row in enumerate(sheet.iter_rows(min_row=2, max_col=11, max_row=sheet.max_row), start=2):
-    number_cell = row[0]  # Первая ячейка строки содержит номер
-    inn_cell = row[2]  # Третья ячейка строки содержит ИНН
-    name_for_folder_cell = row[8]  # Девятая ячейка строки содержит имя для папки
-    name_gosuslugi_cell = row[1]  # Вторая ячейка строки содержит имя, зарегистрированное в Госуслугах
-    name_for_folder = name_for_folder_cell.value  # Значение из ячейки имени для папки
-    inn = int(inn_cell.value)  # Значение ИНН, преобразованное в целое число
-    number = number_cell.value  # Значение номера
-    name_gosuslugi = name_gosuslugi_cell.value  # Значение имени, зарегистрированного в Госуслугах
-
-    folder_name = f"{number}. {name_for_folder} ({inn})"  # Формирование имени папки
-    folder_path = f"disk:/ИПР/{folder_name}"  # Формирование пути к папке на Яндекс.Диске
-
-    # Получение последней и предпоследней даты обновления папки
-    latest_date, before_latest_date, folder_exists = get_dates_from_folder(API_TOKEN, folder_path)
-
-    # Если папка не существует, запись предупреждения в лог
-    if not folder_exists:
-        logging.warning(f"Folder does not exist for row number {row_num}")
-        continue
-
-    # Сохранение старых значений для последующего сравнения
-    old_val_10 = sheet.cell(row=row_num, column=10).value
-    old_val_11 = sheet.cell(row=row_num, column=11).value
-
-    # Запись новых дат в лист Excel
-    sheet.cell(row=row_num, column=10).value = latest_date.strftime("%d.%m.%Y") if isinstance(latest_date, datetime) else 'Отсутствует'
-    sheet.cell(row=row_num, column=11).value = before_latest_date.strftime("%d.%m.%Y") if isinstance(before_latest_date, datetime) else 'Отсутствует'
-
-    # Получение новых значений для сравнения с старыми
-    new_val_10 = sheet.cell(row=row_num, column=10).value
-    new_val_11 = sheet.cell(row=row_num, column=11).value
-
-    # Если значения изменились, запись информации об изменении в лог
-    if old_val_10 != new_val_10 or old_val_11 != new_val_11:
-        logging.info(f"Row {row_num}: Changes detected for {name_for_folder} ({inn}) - "
-                     f"last update date: {old_val_10} -> {new_val_10}, "
-                     f"before last update date: {old_val_11} -> {new_val_11}")
-
-# Сохранение изменений в файл Excel
-wb.save("companies.xlsx")
-
-# Запись информации о сохранении изменений в файл журнала
-logging.info("Changes saved to companies.xlsx")
+    return all_dates[0] if all_dates else 'Отсутствует', all_dates[1] if len(all_dates) > 1 else 'Отсутствует'
+
+
+# Функция для получения дат из имен папок на Яндекс.Диске
+def get_dates_from_folder(token, folder_path):
+    url = f"{BASE_URL}?path={folder_path}"  # Формирование URL для запроса содержимого папки
+    folder_content = get_folder_content(url, token)  # Получение содержимого папки
+
+    if 'error' in folder_content:
+        return None, None, False  # Возврат значений None, если в ответе есть ошибка
+
+    if '_embedded' not in folder_content:
+        return None, None, True  # Возврат значений None, если в ответе нет ключа '_embedded'
+
+    return (*latest_dates(folder_content['_embedded']['items']), True)
+
+
+# Класс локального кэша папок: время изменения папки и вычисленные по ней даты
+class FolderCache:
+    def __init__(self, path=CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS folders (
+                                 name TEXT PRIMARY KEY,
+                                 modified TEXT NOT NULL,
+                                 latest_date TEXT NOT NULL,
+                                 before_latest_date TEXT NOT NULL)""")
+
+    # Метод получения записи: (время изменения, последняя дата, предпоследняя дата) или None
+    def get(self, name):
+        row = self.conn.execute('SELECT modified, latest_date, before_latest_date FROM folders WHERE name = ?',
+                                (name,)).fetchone()
+        if row is None:
+            return None
+        return row[0], self._load_date(row[1]), self._load_date(row[2])
+
+    # Метод сохранения времени изменения папки и вычисленных дат
+    def put(self, name, modified, latest_date, before_latest_date):
+        self.conn.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)',
+                          (name, modified, self._dump_date(latest_date), self._dump_date(before_latest_date)))
+
+    # Метод фиксации изменений и закрытия базы
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    @staticmethod
+    def _dump_date(value):
+        return value.strftime("%Y-%m-%d") if isinstance(value, datetime) else value
+
+    @staticmethod
+    def _load_date(value):
+        return datetime.strptime(value, "%Y-%m-%d") if value != 'Отсутствует' else value
+
+
+# Функция для получения индекса "имя папки -> элемент" по содержимому родительской папки.
+# Не зависит от списка компаний, поэтому main.py читает её одновременно с проверкой статусов
+def parent_index(token):
+    parent_items = list_folder_items(token, PARENT_PATH, fields=("name", "type", "path", "modified")) or []
+    return {item['name']: item for item in parent_items if item['type'] == 'dir'}
+
+
+# Функция для получения дат по всем папкам компаний: родительская папка читается один раз (или берётся
+# уже прочитанный index), а вложенные запрашиваются параллельно и только у существующих папок,
+# изменившихся с прошлого запуска
+def get_dates_bulk(token, folder_names, workers=DEFAULT_WORKERS, cache=None, index=None):
+    if index is None:
+        index = parent_index(token)
+
+    # Результат: имя папки -> (последняя дата, предпоследняя дата, папка существует);
+    # отсутствие папки определяется без запроса
+    dates = {folder_name: (None, None, False) for folder_name in folder_names}
+    stats = {'skipped': 0, 'refreshed': 0, 'new': 0}  # Статистика по папкам для журнала
+
+    # Папки с прежним временем изменения берутся из кэша без запроса содержимого
+    changed = []
+    for folder_name in dates:
+        if folder_name not in index:
+            continue
+        cached = cache.get(folder_name) if cache is not None else None
+        if cached is not None and cached[0] == index[folder_name].get('modified'):
+            dates[folder_name] = (cached[1], cached[2], True)
+            stats['skipped'] += 1
+        else:
+            changed.append(folder_name)
+            stats['refreshed' if cached is not None else 'new'] += 1
+
+    listings = client.map(lambda folder_name: list_folder_items(token, index[folder_name]['path']), changed, workers)
+    for folder_name, items in zip(changed, listings):
+        if items is not None:
+            dates[folder_name] = (*latest_dates(items), True)
+            if cache is not None:
+                cache.put(folder_name, index[folder_name].get('modified', ''), *dates[folder_name][:2])
+
+    logging.info(f"Folders: {stats['skipped']} skipped (unchanged), {stats['refreshed']} refreshed, "
+                 f"{stats['new']} new")
+    return dates
+
+
+# Функция для формирования имени папки компании: номер, имя для папки и ИНН
+def folder_name_of(company):
+    return NAMES.folder_key(company['number'], company['name_for_folder'], company['inn'])
+
+
+# Функция для формирования возможных имён папки компании: текущее и прежние (previous - прежние NAME_FOR_FOLDER).
+# После смены имени для папки папка на Диске остаётся под прежним именем, пока её не переименуют
+def folder_names_of(company, previous=()):
+    names = [folder_name_of(company)] + [NAMES.folder_key(company['number'], name, company['inn']) for name in previous]
+    return list(dict.fromkeys(names))
+
+
+# Функция выбора существующей папки среди возможных имён; dates - имя папки -> (последняя, предпоследняя дата,
+# папка существует). Если папка найдена под прежним именем, в лог записывается предупреждение
+def find_folder(dates, folder_names, label):
+    for folder_name in folder_names:
+        if dates[folder_name][2]:
+            if folder_name != folder_names[0]:
+                logging.warning(f"{label}: folder found under previous name '{folder_name}', "
+                                f"rename it to '{folder_names[0]}'")
+            return dates[folder_name]
+    return dates[folder_names[0]]
+
+
+# Функция записи дат из папки компании в хранилище и в ленту изменений; возвращает True, если даты изменились
+def apply_dates(conn, company, latest_date, before_latest_date, label):
+    # Старые и новые значения для сравнения
+    old_dates = (company['last_date'], company['before_last_date'])
+    new_dates = (STORE.date_to_store(latest_date), STORE.date_to_store(before_latest_date))
+
+    # В хранилище записываются только изменившиеся компании
+    if old_dates == new_dates and company['folder_found']:
+        return False
+    STORE.update_company(conn, company['id'], last_date=new_dates[0], before_last_date=new_dates[1], folder_found=1)
+    STORE.record_change(conn, STORE.DATES_CHANGED, company['id'], company['inn'],
+                        dict(zip(STORE.DATE_FIELDS, old_dates)), dict(zip(STORE.DATE_FIELDS, new_dates)))
+    old_val_10, old_val_11 = (STORE.date_from_store(value, company['folder_found']) for value in old_dates)
+    new_val_10, new_val_11 = (STORE.date_from_store(value, 1) for value in new_dates)
+    # Запись информации об изменении в лог
+    logging.info(f"{label}: Changes detected for {company['name_for_folder']} ({int(company['inn'])}) - "
+                 f"last update date: {old_val_10} -> {new_val_10}, "
+                 f"before last update date: {old_val_11} -> {new_val_11}")
+    return True
+
+
+# Функция для разбора аргументов командной строки
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Обновление дат из папок компаний на Яндекс.Диске')
+    parser.add_argument('--mode', choices=['per-row', 'bulk'], default='bulk',
+                        help='per-row: запрос на каждую строку; bulk: один обход родительской папки')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Число одновременных запросов к API Яндекс.Диска')
+    parser.add_argument('--force-refresh', action='store_true',
+                        help='Не использовать кэш метаданных и перечитать все папки')
+    return parser.parse_args(argv)
+
+
+# Основная функция обновления дат; список компаний читается из хранилища, поэтому в нём уже есть имена
+# для папок, записанные check_status; index - уже прочитанное содержимое родительской папки (при запуске из main.py)
+def main(argv=None, index=None):
+    args = parse_args(argv)
+
+    # Чтение компаний из хранилища
+    conn = STORE.connect()
+    companies = STORE.load_companies(conn)
+
+    # Формирование имён папок для всех компаний (номер строки - как в выгрузке Excel);
+    # прежние имена проверяются, если папку после смены имени не переименовали
+    previous = STORE.previous_folder_names(conn)
+    rows = [(row_num, company, folder_names_of(company, previous.get(company['id'], ())))
+            for row_num, company in enumerate(companies, start=2)]
+
+    # Получение последней и предпоследней даты обновления папок в выбранном режиме
+    folder_names = list(dict.fromkeys(folder_name for *_, names in rows for folder_name in names))
+    if args.mode == 'bulk':
+        cache = FolderCache()
+        if args.force_refresh:
+            cache.conn.execute('DELETE FROM folders')
+        dates = get_dates_bulk(API_TOKEN, folder_names, args.workers, cache, index)
+        cache.close()
+    else:
+        listings = client.map(lambda folder_name: get_dates_from_folder(API_TOKEN, f"{PARENT_PATH}/{folder_name}"),
+                              folder_names, args.workers)
+        dates = dict(zip(folder_names, listings))
+    logging.info(f"Yandex Disk: {client.request_count} requests (mode {args.mode})")
+
+    changed = 0  # Количество компаний с изменившимися датами
+    for row_num, company, names in rows:
+        latest_date, before_latest_date, folder_exists = find_folder(dates, names, f"Row {row_num}")
+
+        # Если папка не существует, запись предупреждения в лог
+        if not folder_exists:
+            logging.warning(f"Folder does not exist for row number {row_num}")
+            continue
+
+        changed += apply_dates(conn, company, latest_date, before_latest_date, f"Row {row_num}")
+
+    # Фиксация изменений в хранилище
+    conn.commit()
+    conn.close()
+
+    # Запись информации о сохранении изменений в файл журнала
+    logging.info(f"Changes saved to {STORE.STORE_PATH}: {changed} companies updated")
+
+
+if __name__ == '__main__':
+    # Настройка логирования для записи в файл 'changes.log' с уровнем важности INFO и определённым форматом сообщений
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+                            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+                        ]
+                    )
+    with METRICS.stage('ya_disk'):
+        main()
+    METRICS.write_reports()
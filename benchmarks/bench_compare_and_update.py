@@ -0,0 +1,138 @@
+# Сравнение прежней и новой реализации объединения списков компаний и выгрузки в Excel
+# на синтетических данных. Запуск из корня репозитория:
+#   python benchmarks/bench_compare_and_update.py --sizes 1000,10000,100000
+import argparse  # Разбор аргументов командной строки
+import json  # Сохранение результатов
+import os  # Работа с путями
+import random  # Генерация синтетических данных
+import sys  # Путь к модулям репозитория
+import tempfile  # Временные файлы Excel
+import time  # Замер времени
+
+import numpy as np  # Прежняя реализация использует np.nan
+import openpyxl  # Прежняя реализация красной заливки
+import pandas as pd  # Работа с таблицами
+from openpyxl.styles import PatternFill  # Прежняя реализация красной заливки
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import STORE  # noqa: E402  Новая выгрузка в Excel
+from main import split_companies, EXCLUDE_INNS  # noqa: E402  Новое объединение по ИНН
+
+STATUSES = ['Действующая'] * 13 + ['Ликвидирована']  # Примерно 7% недействующих компаний
+
+
+# Функция генерации таблицы компаний с заголовками Excel
+def make_companies(size, seed=0):
+    rng = random.Random(seed)
+    inns = rng.sample(range(10 ** 9, 10 ** 10), size)
+    return pd.DataFrame({
+        '№': range(1, size + 1),
+        'NAME_GOSUSLUGI': [f'ООО "КОМПАНИЯ {i}"' for i in range(size)],
+        'INN': [str(inn) for inn in inns],
+        'STATUS': [rng.choice(STATUSES) for _ in range(size)],
+        'DATE/TIME': '2023-11-02 15:36:57',
+        'COLOR': [('NEW' if rng.random() < 0.05 else np.nan) for _ in range(size)],
+        'SHORT_NAME_DADATA': [f'ООО "КОМПАНИЯ {i}"' for i in range(size)],
+        'FULL_NAME_DADATA': [f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "КОМПАНИЯ {i}"' for i in range(size)],
+        'NAME_FOR_FOLDER': [f'КОМПАНИЯ {i}' for i in range(size)],
+        'LAST_DATE': 'Отсутствует',
+        'BEFORE_LAST_DATE': 'Отсутствует',
+        'LAST_DATE.1': np.nan,
+        'URL': np.nan,
+    })
+
+
+# Функция генерации нового списка с сайта: 1% компаний исчезает, 1% добавляется
+def make_scraped(old_data, seed=1):
+    rng = random.Random(seed)
+    kept = old_data.sample(frac=0.99, random_state=seed)[['NAME_GOSUSLUGI', 'INN']]
+    extra = max(1, len(old_data) // 100)
+    new = pd.DataFrame({'NAME_GOSUSLUGI': [f'АО "НОВАЯ {i}"' for i in range(extra)],
+                        'INN': [str(rng.randrange(10 ** 10, 10 ** 11)) for _ in range(extra)]})
+    scraped = pd.concat([kept, new], ignore_index=True)
+    scraped['STATUS'] = 'Действующая'
+    scraped['DATE/TIME'] = '2023-11-03 10:00:00'
+    return scraped
+
+
+# Прежнее объединение из main.compare_and_update (без чтения и записи файла)
+def legacy_merge(old_data, companies):
+    old_data = old_data.copy()
+    common_inns = old_data[old_data["INN"].isin(companies["INN"])]["INN"]
+    old_data.loc[old_data["INN"].isin(common_inns), 'COLOR'] = np.nan
+    added = companies[~companies["INN"].isin(old_data["INN"]) & ~companies["INN"].isin(EXCLUDE_INNS)].copy()
+    max_number = old_data['№'].fillna(0).astype(int).max()
+    added['№'] = range(max_number + 1, max_number + 1 + len(added))
+    added['COLOR'] = 'NEW'
+    return pd.concat([old_data, added], ignore_index=True)
+
+
+# Новое объединение: одно соединение по ИНН
+def new_merge(old_data, companies):
+    old_data = old_data.copy()
+    added, removed, common = split_companies(old_data, companies)
+    old_data.loc[(old_data['COLOR'] == 'NEW') & old_data['INN'].isin(common), 'COLOR'] = np.nan
+    max_number = old_data['№'].fillna(0).astype(int).max()
+    added['№'] = range(max_number + 1, max_number + 1 + len(added))
+    added['COLOR'] = 'NEW'
+    return pd.concat([old_data, added], ignore_index=True)
+
+
+# Прежняя выгрузка: зелёный цвет по ячейкам (main.save_to_excel) и красный по ячейкам (CHECK_STATUS.py)
+def legacy_save(companies, file_name):
+    writer = pd.ExcelWriter(file_name, engine='xlsxwriter')
+    companies.to_excel(writer, index=False)
+    worksheet = writer.sheets['Sheet1']
+    green_format = writer.book.add_format({'bg_color': '#00FF00'})
+    for index, row in companies.iterrows():
+        if row.get('COLOR') == 'NEW':
+            for col_num, value in enumerate(row):
+                if pd.notnull(value):
+                    worksheet.write(index + 1, col_num, value, green_format)
+    writer.close()
+
+    workbook = openpyxl.load_workbook(file_name)
+    sheet = workbook.active
+    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+    for index, status in enumerate(companies['STATUS'], start=2):
+        if status != "Действующая":
+            for col_letter in ['A', 'B', 'C', 'E', 'D', 'F', 'G', 'H', 'I', 'J']:
+                sheet[f'{col_letter}{index}'].fill = red_fill
+    workbook.save(file_name)
+
+
+# Функция замера времени выполнения
+def measure(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк объединения и выгрузки в Excel')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Размеры таблиц через запятую')
+    parser.add_argument('--output', help='Файл JSON для сохранения результатов')
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'rows':>8} {'merge old':>10} {'merge new':>10} {'save old':>10} {'save new':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            old_data = make_companies(size)
+            scraped = make_scraped(old_data)
+            merge_old, combined_old = measure(legacy_merge, old_data, scraped)
+            merge_new, combined_new = measure(new_merge, old_data, scraped)
+            assert len(combined_old) == len(combined_new)
+            save_old, _ = measure(legacy_save, combined_old, os.path.join(tmp, 'old.xlsx'))
+            save_new, _ = measure(STORE.write_excel, combined_new, os.path.join(tmp, 'new.xlsx'))
+            results.append({'rows': size, 'merge_old_s': merge_old, 'merge_new_s': merge_new,
+                            'save_old_s': save_old, 'save_new_s': save_new})
+            print(f"{size:>8} {merge_old:>10.3f} {merge_new:>10.3f} {save_old:>10.3f} {save_new:>10.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+# Сквозной бенчмарк всего конвейера на локальных заменителях госуслуг, DaData, Яндекс.Диска и Google Sheets.
+# Каждый этап запускается в отдельном процессе (для честного замера пиковой памяти) в общей рабочей папке,
+# поэтому хранилище и кэши сохраняются между этапами и повторами. Запуск из корня репозитория:
+#   python benchmarks/bench_pipeline.py --size 1000 --latency 0.02 --output bench_pipeline.json
+import argparse  # Разбор аргументов командной строки
+import json  # Сохранение результатов
+import logging  # Журнал этапов пишется в рабочую папку
+import multiprocessing  # Отдельный процесс на каждый этап
+import os  # Работа с путями
+import platform  # Сведения о машине в результатах
+import resource  # Пиковая память процесса
+import shlex  # Разбор аргументов этапов
+import sys  # Путь к модулям репозитория
+import tempfile  # Временная рабочая папка
+import time  # Замер времени
+from datetime import datetime  # Время запуска в результатах
+
+from fake_services import Dataset, ServiceConfig, start_services  # Заменители внешних сервисов
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STAGES = ['scrape', 'check_status', 'ya_disk', 'google_sheets']  # Этапы в порядке выполнения
+STAGE_SERVICES = {  # Сервис, к которому обращается этап
+    'scrape': 'gosuslugi',
+    'check_status': 'dadata',
+    'ya_disk': 'yandex_disk',
+    'google_sheets': 'google_sheets',
+}
+
+
+# Сессия requests, перенаправляющая запросы gspread с адресов Google на локальный заменитель
+def redirect_session(base_url):
+    import requests
+
+    class RedirectSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            for prefix in ('https://sheets.googleapis.com', 'https://www.googleapis.com'):
+                if url.startswith(prefix):
+                    url = base_url + url[len(prefix):]
+            return super().request(method, url, *args, **kwargs)
+
+    return RedirectSession()
+
+
+# Функция выполнения одного этапа; возвращает число обработанных элементов
+def execute_stage(stage, urls, argv):
+    import STORE
+    if stage == 'scrape':
+        import SCRAPER
+        import main
+        SCRAPER.IPR_API_URL = urls['gosuslugi']
+        main.scrape(main.parse_args(['--fetcher', 'http']))
+    elif stage == 'check_status':
+        from dadata.sync import SuggestClient
+        import CHECK_STATUS
+        SuggestClient.BASE_URL = urls['dadata'] + '/suggestions/api/4_1/rs/'
+        CHECK_STATUS.token = 'bench'
+        CHECK_STATUS.main(argv)
+    elif stage == 'ya_disk':
+        import YA_DISK
+        YA_DISK.BASE_URL = urls['yandex_disk'] + '/v1/disk/resources'
+        YA_DISK.API_TOKEN = 'bench'
+        YA_DISK.main(argv)
+    elif stage == 'google_sheets':
+        import gspread
+        import GOOGLE_SHEETS
+        GOOGLE_SHEETS.main(gspread.Client(auth=None, session=redirect_session(urls['google_sheets'])))
+    conn = STORE.connect(excel_path=None)
+    count = len(STORE.load_companies(conn))
+    conn.close()
+    return count
+
+
+# Точка входа дочернего процесса: этап выполняется в рабочей папке, результат передаётся через очередь
+def run_stage(stage, urls, argv, workdir, queue):
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler('changes.log', mode='a')])
+    started = time.perf_counter()
+    error = None
+    items = 0
+    try:
+        items = execute_stage(stage, urls, argv)
+    except Exception as e:
+        logging.error(f'Этап {stage} завершился ошибкой: {e}', exc_info=True)
+        error = f'{type(e).__name__}: {e}'
+    wall_time = time.perf_counter() - started
+    import METRICS  # Замеры внешних вызовов, накопленные этапом
+    # ru_maxrss в Linux - в килобайтах
+    queue.put({'wall_time_s': wall_time, 'items': items, 'error': error,
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+               'calls': METRICS.registry.summary()['calls']})
+
+
+# Функция разбора настроек сервиса вида "dadata:latency=0.05,error_rate=0.1,rate_limit=20"
+def parse_service_config(value):
+    name, _, options = value.partition(':')
+    fields = {}
+    for option in filter(None, options.split(',')):
+        key, _, number = option.partition('=')
+        if key not in ('latency', 'error_rate', 'rate_limit'):
+            raise argparse.ArgumentTypeError(f'Неизвестный параметр сервиса: {key}')
+        fields[key] = float(number)
+    return name, fields
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Сквозной бенчмарк конвейера на локальных заменителях сервисов')
+    parser.add_argument('--size', type=int, default=1000, help='Количество синтетических компаний')
+    parser.add_argument('--folder-share', type=float, default=0.8, help='Доля компаний с папкой на Диске')
+    parser.add_argument('--dates-per-folder', type=int, default=5, help='Количество папок с датами у компании')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа всех сервисов в секундах')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503 у всех сервисов')
+    parser.add_argument('--rate-limit', type=float, help='Допустимое число запросов в секунду у всех сервисов')
+    parser.add_argument('--service', type=parse_service_config, action='append', default=[],
+                        help='Настройки одного сервиса, например dadata:latency=0.05,rate_limit=20')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Этапы через запятую')
+    parser.add_argument('--stage-args', action='append', default=[],
+                        help='Аргументы этапа, например "check_status=--mode serial"')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Количество прогонов подряд (второй и следующие - с заполненными кэшами)')
+    parser.add_argument('--workdir', help='Рабочая папка (по умолчанию - временная)')
+    parser.add_argument('--output', default='bench_pipeline.json', help='Файл JSON с результатами')
+    args = parser.parse_args(argv)
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f'Неизвестные этапы: {", ".join(sorted(unknown))}')
+    stage_args = {}
+    for value in args.stage_args:
+        stage, _, stage_argv = value.partition('=')
+        stage_args[stage] = shlex.split(stage_argv)
+    args.stage_args = stage_args
+    return args
+
+
+# Функция запуска всех выбранных этапов один раз; возвращает результаты по этапам
+def run_pipeline(args, services, urls, workdir, run):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for stage in args.stages:
+        service = services[STAGE_SERVICES[stage]]
+        before = service.snapshot()
+        queue = context.Queue()
+        process = context.Process(target=run_stage,
+                                  args=(stage, urls, args.stage_args.get(stage, []), workdir, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        after = service.snapshot()
+        result.update({'run': run, 'stage': stage, 'service': STAGE_SERVICES[stage],
+                       'requests': after['requests'] - before['requests'],
+                       'errors_served': after['errors'] - before['errors'],
+                       'throttled': after['throttled'] - before['throttled']})
+        result['throughput_per_s'] = result['items'] / result['wall_time_s'] if result['wall_time_s'] else None
+        results.append(result)
+        print(f"{run:>3} {stage:<14} {result['wall_time_s']:>9.2f} {result['requests']:>9} "
+              f"{result['peak_rss_mb']:>9.1f} {result['throughput_per_s'] or 0:>11.1f}"
+              + (f"  {result['error']}" if result['error'] else ''))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Общие настройки и настройки отдельных сервисов
+    configs = {}
+    for name in STAGE_SERVICES.values():
+        configs[name] = ServiceConfig(args.latency, args.error_rate, args.rate_limit)
+    for name, fields in args.service:
+        if name not in configs:
+            raise SystemExit(f'Неизвестный сервис: {name}')
+        for key, value in fields.items():
+            setattr(configs[name], key, value)
+
+    dataset = Dataset(args.size, folder_share=args.folder_share, dates_per_folder=args.dates_per_folder)
+    services = start_services(dataset, configs)
+    urls = {name: service.url for name, service in services.items()}
+
+    temporary = None
+    if args.workdir:
+        workdir = os.path.abspath(args.workdir)
+        os.makedirs(workdir, exist_ok=True)
+    else:
+        temporary = tempfile.TemporaryDirectory()
+        workdir = temporary.name
+
+    print(f"{'run':>3} {'stage':<14} {'wall, s':>9} {'requests':>9} {'rss, MB':>9} {'items/s':>11}")
+    started = time.perf_counter()
+    stages = []
+    try:
+        for run in range(1, args.repeat + 1):
+            stages.extend(run_pipeline(args, services, urls, workdir, run))
+    finally:
+        for service in services.values():
+            service.stop()
+        if temporary is not None:
+            temporary.cleanup()
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'dataset': dataset.as_dict(),
+        'services': {name: config.as_dict() for name, config in configs.items()},
+        'stage_args': args.stage_args,
+        'total_wall_time_s': time.perf_counter() - started,
+        'stages': stages,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Результаты записаны в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
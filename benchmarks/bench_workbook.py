@@ -0,0 +1,140 @@
+# Сравнение прежнего (pandas, лист целиком в памяти) и потокового (WORKBOOK.py) чтения и записи Excel
+# на синтетических таблицах. Каждый замер выполняется в отдельном процессе, чтобы пиковая память (RSS)
+# относилась только к нему. Запуск из корня репозитория:
+#   python benchmarks/bench_workbook.py --sizes 10000,100000 --output bench_workbook.json
+import argparse  # Разбор аргументов командной строки
+import json  # Сохранение результатов
+import multiprocessing  # Отдельный процесс на каждый замер
+import os  # Работа с путями
+import sys  # Путь к модулям репозитория
+import tempfile  # Временные файлы Excel и хранилища
+import time  # Замер времени
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import STORE  # noqa: E402  Хранилище и выгрузка в Excel
+from bench_compare_and_update import make_companies  # noqa: E402  Синтетическая таблица компаний
+
+
+# Прежний перенос Excel в хранилище: файл целиком читается в DataFrame
+def legacy_read(path, store_path):
+    import pandas as pd
+    conn = STORE.connect(store_path, excel_path=None)
+    STORE.add_companies(conn, pd.read_excel(path, dtype={'INN': str}, engine='openpyxl'))
+    conn.commit()
+    conn.close()
+
+
+# Новый перенос: строки читаются и добавляются по одной
+def streaming_read(path, store_path):
+    conn = STORE.connect(store_path, excel_path=None)
+    STORE.import_excel(conn, path)
+    conn.close()
+
+
+# Прежняя выгрузка: хранилище целиком в DataFrame, запись через pandas с общими строками xlsxwriter
+def legacy_write(path, store_path):
+    import pandas as pd
+    from xlsxwriter.utility import xl_col_to_name
+    conn = STORE.connect(store_path, excel_path=None)
+    companies = STORE.load_dataframe(conn)
+    conn.close()
+    writer = pd.ExcelWriter(path, engine='xlsxwriter')
+    companies.to_excel(writer, index=False)
+    worksheet = writer.sheets['Sheet1']
+    columns = list(companies.columns)
+    status = xl_col_to_name(columns.index('STATUS'))
+    color = xl_col_to_name(columns.index('COLOR'))
+    worksheet.conditional_format(1, 0, len(companies), 9, {
+        'type': 'formula', 'criteria': f'=${status}2<>"Действующая"',
+        'format': writer.book.add_format({'bg_color': '#FF0000'})})
+    worksheet.conditional_format(1, 0, len(companies), len(columns) - 1, {
+        'type': 'formula', 'criteria': f'=${color}2="NEW"', 'format': writer.book.add_format({'bg_color': '#00FF00'})})
+    writer.close()
+
+
+# Новая выгрузка: строки читаются из базы и записываются по одной
+def streaming_write(path, store_path):
+    conn = STORE.connect(store_path, excel_path=None)
+    STORE.export_excel(conn, path)
+    conn.close()
+
+
+# Функция чтения пиковой памяти процесса в МБ. ru_maxrss не подходит: при запуске через spawn он
+# сохраняет пик родительского процесса, а VmHWM считается заново для нового процесса
+def peak_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+CASES = {
+    'read_legacy': legacy_read,
+    'read_streaming': streaming_read,
+    'write_legacy': legacy_write,
+    'write_streaming': streaming_write,
+}
+
+
+# Точка входа дочернего процесса: один замер, результат передаётся через очередь.
+# Память до замера (после импорта модулей) вычитается из пиковой
+def run_case(case, path, store_path, queue):
+    sys.path.insert(0, REPO_ROOT)
+    import pandas  # noqa: F401  Импорт библиотек не входит в замер памяти
+    import openpyxl  # noqa: F401
+    import xlsxwriter  # noqa: F401
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    CASES[case](path, store_path)
+    wall_time = time.perf_counter() - started
+    peak = peak_rss_mb()
+    queue.put({'wall_time_s': round(wall_time, 3), 'peak_rss_mb': round(peak, 1),
+               'extra_rss_mb': round(peak - baseline, 1)})
+
+
+# Функция выполнения замера в отдельном процессе
+def measure(case, path, store_path):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, path, store_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк чтения и записи Excel')
+    parser.add_argument('--sizes', default='10000,100000', help='Количество строк через запятую')
+    parser.add_argument('--output', default='bench_workbook.json', help='Файл JSON с результатами')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rows':>8} {'case':<16} {'time, s':>9} {'rss, MB':>9} {'+rss, MB':>9}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'companies.xlsx')
+            STORE.write_excel(make_companies(size), source)
+            for case in CASES:
+                # Чтение - в новое хранилище, запись - из хранилища, заполненного один раз
+                store_path = os.path.join(tmp, f'{case}.sqlite' if case.startswith('read') else 'store.sqlite')
+                if case.startswith('write') and not os.path.exists(store_path):
+                    streaming_read(source, store_path)
+                target = source if case.startswith('read') else os.path.join(tmp, f'{case}.xlsx')
+                result = {'rows': size, 'case': case, **measure(case, target, store_path)}
+                if case.startswith('write'):
+                    result['file_mb'] = round(os.path.getsize(target) / 2 ** 20, 2)
+                results.append(result)
+                print(f"{size:>8} {case:<16} {result['wall_time_s']:>9.2f} {result['peak_rss_mb']:>9.1f} "
+                      f"{result['extra_rss_mb']:>9.1f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f'Результаты записаны в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
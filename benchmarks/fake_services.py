@@ -0,0 +1,267 @@
+# Локальные заменители внешних сервисов для бенчмарков: госуслуги (список ИПР), DaData,
+# Яндекс.Диск и Google Sheets. Каждый сервис - отдельный HTTP-сервер на 127.0.0.1 со своими
+# настройками задержки, доли ошибок и ограничения частоты запросов.
+import json  # Тела запросов и ответов
+import random  # Синтетические данные, случайные ошибки
+import threading  # Сервер работает в фоновом потоке
+import time  # Задержка ответа и ограничение частоты
+from datetime import datetime, timedelta  # Даты в именах папок и время изменения папок
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Встроенный HTTP-сервер
+from urllib.parse import urlsplit, parse_qs, unquote  # Разбор адреса запроса
+
+PARENT_PATH = "disk:/ИПР"  # Родительская папка компаний, как в YA_DISK.py
+SPREADSHEET_ID = "bench"  # Идентификатор таблицы в заменителе Google Sheets
+SPREADSHEET_TITLE = "table_for_work"  # Название таблицы, которое открывает GOOGLE_SHEETS.py
+STATUSES = ["ACTIVE"] * 30 + ["LIQUIDATING", "LIQUIDATED", "REORGANIZING"]  # Около 9% недействующих
+
+
+# Класс настроек одного сервиса
+class ServiceConfig:
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=None):
+        self.latency = latency  # Задержка каждого ответа в секундах
+        self.error_rate = error_rate  # Доля запросов, на которые отвечается ошибкой 503
+        self.rate_limit = rate_limit  # Допустимое число запросов в секунду (сверх - ответ 429), None - без ограничения
+
+    def as_dict(self):
+        return {'latency': self.latency, 'error_rate': self.error_rate, 'rate_limit': self.rate_limit}
+
+
+# Класс синтетического набора данных: компании, ответы DaData и дерево папок на Диске
+class Dataset:
+    def __init__(self, size, seed=0, folder_share=0.8, dates_per_folder=5):
+        rng = random.Random(seed)
+        self.size = size
+        inns = rng.sample(range(10 ** 9, 10 ** 10), size)
+        base_date = datetime(2023, 11, 1)
+        self.companies = []
+        for i, inn in enumerate(inns):
+            name = f'КОМПАНИЯ {i}'
+            folder = None
+            if rng.random() < folder_share:
+                # Имя папки строится так же, как в YA_DISK.py: номер, имя для папки и ИНН
+                dates = sorted({base_date - timedelta(days=rng.randrange(365)) for _ in range(dates_per_folder)})
+                folder = {'name': f'{i + 1}. {name} ({inn})', 'dates': dates,
+                          'modified': max(dates).strftime('%Y-%m-%dT%H:%M:%S+00:00')}
+            self.companies.append({'inn': str(inn), 'name': name, 'status': rng.choice(STATUSES), 'folder': folder})
+        self.by_inn = {company['inn']: company for company in self.companies}
+        self.folders = {company['folder']['name']: company['folder']
+                        for company in self.companies if company['folder']}
+
+    def as_dict(self):
+        return {'size': self.size, 'folders': len(self.folders)}
+
+
+# Базовый класс сервиса: HTTP-сервер со счётчиками, задержкой, ошибками и ограничением частоты
+class FakeService(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dataset, config=None):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.dataset = dataset
+        self.config = config or ServiceConfig()
+        self.rng = random.Random(1)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self.window = (0, 0)  # (текущая секунда, число запросов в ней) для ограничения частоты
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # Снимок счётчиков для вычисления числа запросов за этап
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+    # Решение о судьбе запроса: None - обработать, иначе (код ответа, заголовки)
+    def admit(self):
+        with self.lock:
+            self.counters['requests'] += 1
+            if self.config.rate_limit:
+                second = int(time.monotonic())
+                current, count = self.window
+                count = count + 1 if current == second else 1
+                self.window = (second, count)
+                if count > self.config.rate_limit:
+                    self.counters['throttled'] += 1
+                    return 429, {'Retry-After': '1'}
+            if self.config.error_rate and self.rng.random() < self.config.error_rate:
+                self.counters['errors'] += 1
+                return 503, {}
+        return None
+
+    # Обработка запроса конкретным сервисом: возвращает (код ответа, тело JSON)
+    def respond(self, method, path, query, body):
+        raise NotImplementedError
+
+
+# Обработчик HTTP-запросов, общий для всех сервисов
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Соединения переиспользуются клиентами
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        service = self.server
+        if service.config.latency:
+            time.sleep(service.config.latency)
+        rejected = service.admit()
+        if rejected is not None:
+            status, headers = rejected
+            payload = {'error': 'rate limit' if status == 429 else 'unavailable'}
+        else:
+            parts = urlsplit(self.path)
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            status, payload = service.respond(method, unquote(parts.path), query, body)
+            headers = {}
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Запросы не выводятся в консоль
+
+
+# Заменитель JSON-запроса списка компаний ИПР (SCRAPER.IPR_API_URL)
+class GosuslugiService(FakeService):
+    def respond(self, method, path, query, body):
+        content = [{'name': f'Общество с ограниченной ответственностью "{company["name"]}"', 'inn': company['inn']}
+                   for company in self.dataset.companies]
+        return 200, {'content': content, 'totalElements': len(content)}
+
+
+# Заменитель DaData: findById/party
+class DadataService(FakeService):
+    def respond(self, method, path, query, body):
+        if not path.endswith('/findById/party'):
+            return 404, {'message': 'not found'}
+        company = self.dataset.by_inn.get(str(body.get('query')))
+        if company is None:
+            return 200, {'suggestions': []}
+        short = f'ООО "{company["name"]}"'
+        return 200, {'suggestions': [{'value': short, 'data': {
+            'inn': company['inn'],
+            'state': {'status': company['status'], 'actuality_date': 1698796800000},
+            'name': {'short_with_opf': short,
+                     'full_with_opf': f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "{company["name"]}"'}}}]}
+
+
+# Заменитель API Яндекс.Диска: /v1/disk/resources с постраничным выводом
+class YandexDiskService(FakeService):
+    def respond(self, method, path, query, body):
+        folder_path = query.get('path', '')
+        if folder_path == PARENT_PATH:
+            items = [{'name': name, 'type': 'dir', 'path': f'{PARENT_PATH}/{name}', 'modified': folder['modified']}
+                     for name, folder in self.dataset.folders.items()]
+        elif folder_path.startswith(PARENT_PATH + '/') and folder_path[len(PARENT_PATH) + 1:] in self.dataset.folders:
+            folder = self.dataset.folders[folder_path[len(PARENT_PATH) + 1:]]
+            items = [{'name': f'{date:%d.%m.%y} на проверку', 'type': 'dir'} for date in folder['dates']]
+        else:
+            return 404, {'error': 'DiskNotFoundError', 'message': 'Не удалось найти запрошенный ресурс.'}
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 20))
+        return 200, {'_embedded': {'items': items[offset:offset + limit], 'total': len(items),
+                                   'offset': offset, 'limit': limit}}
+
+
+# Заменитель Google Drive и Sheets API: одна таблица с одним листом, содержимое хранится в памяти
+class GoogleSheetsService(FakeService):
+    def __init__(self, dataset, config=None, rows=1000, columns=26):
+        super().__init__(dataset, config)
+        self.grid = []  # Значения ячеек в том виде, в каком их возвращает get_all_values
+        self.row_count = rows
+        self.column_count = columns
+
+    def respond(self, method, path, query, body):
+        sheet = f'/v4/spreadsheets/{SPREADSHEET_ID}'
+        if path == '/drive/v3/files':
+            return 200, {'files': [{'id': SPREADSHEET_ID, 'name': SPREADSHEET_TITLE,
+                                    'createdTime': '2023-11-01T00:00:00Z', 'modifiedTime': '2023-11-01T00:00:00Z'}]}
+        if path == sheet:
+            properties = {'sheetId': 0, 'title': 'Sheet1', 'index': 0, 'sheetType': 'GRID',
+                          'gridProperties': {'rowCount': self.row_count, 'columnCount': self.column_count}}
+            return 200, {'spreadsheetId': SPREADSHEET_ID, 'properties': {'title': SPREADSHEET_TITLE},
+                         'sheets': [{'properties': properties}]}
+        if path.startswith(sheet + '/values/'):
+            with self.lock:
+                values = [list(row) for row in self.grid]
+            # Пустые строки в конце листа API не возвращает
+            while values and not any(values[-1]):
+                values.pop()
+            return 200, {'range': 'Sheet1', 'majorDimension': 'ROWS', 'values': values}
+        if path == sheet + ':batchUpdate':
+            with self.lock:
+                for request in body.get('requests', []):
+                    self.apply(request)
+            return 200, {'spreadsheetId': SPREADSHEET_ID, 'replies': [{} for _ in body.get('requests', [])]}
+        return 404, {'error': {'code': 404, 'message': 'not found'}}
+
+    # Применение одного изменения batchUpdate к содержимому листа (форматирование не хранится)
+    def apply(self, request):
+        if 'appendDimension' in request:
+            self.row_count += request['appendDimension']['length']
+        elif 'updateCells' in request:
+            update = request['updateCells']
+            grid = update['range']
+            if 'rows' in update:
+                # Запись значений, начиная с левого верхнего угла диапазона
+                for r, row in enumerate(update['rows'], start=grid['startRowIndex']):
+                    for c, cell in enumerate(row['values'], start=grid['startColumnIndex']):
+                        self.set_cell(r, c, self.cell_text(cell.get('userEnteredValue', {})))
+            else:
+                # Очистка диапазона
+                for r in range(grid['startRowIndex'], min(grid['endRowIndex'], len(self.grid))):
+                    for c in range(grid['startColumnIndex'], min(grid['endColumnIndex'], len(self.grid[r]))):
+                        self.grid[r][c] = ''
+                    while self.grid[r] and self.grid[r][-1] == '':
+                        self.grid[r].pop()
+
+    def set_cell(self, r, c, text):
+        while len(self.grid) <= r:
+            self.grid.append([])
+        line = self.grid[r]
+        while len(line) <= c:
+            line.append('')
+        line[c] = text
+
+    @staticmethod
+    def cell_text(value):
+        if 'numberValue' in value:
+            number = value['numberValue']
+            return str(int(number)) if float(number).is_integer() else str(number)
+        return str(value.get('stringValue', ''))
+
+
+SERVICES = {
+    'gosuslugi': GosuslugiService,
+    'dadata': DadataService,
+    'yandex_disk': YandexDiskService,
+    'google_sheets': GoogleSheetsService,
+}
+
+
+# Функция запуска всех сервисов; configs - настройки по имени сервиса
+def start_services(dataset, configs=None):
+    configs = configs or {}
+    return {name: service_class(dataset, configs.get(name)).start() for name, service_class in SERVICES.items()}
@@ -1,133 +1,66 @@
 # Импорт необходимых библиотек
-import os  # Используется для взаимодействия с операционной системой
-import numpy as np  # Популярная библиотека для численных расчетов
-import shutil  # Используется для работы с файлами и папками
 import pandas as pd  # Библиотека для анализа и обработки данных
-from selenium import webdriver  # Инструмент для автоматизации действий в веб-браузере
-from selenium.webdriver.chrome.service import Service  # Сервис для управления ChromeDriver
-from selenium.webdriver.common.by import By  # Используется для указания методов поиска элементов на веб-страницах
-from selenium.webdriver.common.action_chains import ActionChains  # Инструмент для автоматизации комплексных действий пользователя
-import time  # Библиотека для работы со временем
-import re  # Модуль для работы с регулярными выражениями
-from datetime import datetime  # Используется для работы с датами и временем
-import subprocess  # Используется для запуска новых процессов
+from SCRAPER import fetch_companies  # Загрузка списка компаний ИПР (HTTP или Selenium)
+import STORE  # Хранилище данных о компаниях
+import SNAPSHOTS  # Снимки хранилища для резервного копирования и истории изменений
+import time  # Используется для замера времени выполнения этапов
+from concurrent.futures import ThreadPoolExecutor  # Используется для одновременного выполнения независимых запросов
+import CHECK_STATUS  # Этап проверки статусов компаний через DaData
+import YA_DISK  # Этап обновления дат из папок на Яндекс.Диске
+import GOOGLE_SHEETS  # Этап выгрузки в Google Sheets
+import METRICS  # Замеры времени этапов и внешних вызовов
+import BROWSER_POOL  # Пул браузеров для загрузки через Selenium
 import logging  # Библиотека для ведения логов
+import argparse  # Используется для разбора аргументов командной строки
 
-# Конфигурация логгирования
-logging.basicConfig(
-    level=logging.INFO,  # Устанавливаем уровень логгирования - INFO
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Формат вывода логов
-    handlers=[
-        logging.FileHandler('changes.log', mode='w'),  # Логи будут записываться в файл changes.log
-        logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
-    ]
-)
 
 # Функция для извлечения данных о компаниях с веб-страницы
-def extract_company_data(url):
-    # Настройка опций для Chrome
-    chrome_options = webdriver.ChromeOptions()
-    chrome_options.add_argument('--disable-gpu')  # Отключаем GPU для ускорения загрузки
-    chrome_options.add_argument('--headless')  # Режим без графического интерфейса для серверного использования
-
-    # Инициализация драйвера Chrome с заданными опциями
-    driver_service = Service('/usr/bin/chromedriver') #Указать путь к chromedariver
-    browser = webdriver.Chrome(service=driver_service, options=chrome_options)
-
+# fetcher: http - прямой JSON-запрос, selenium - через браузер, auto - http с переходом на selenium при ошибке
+# filters - значения фильтра по названию, загружаемые через Selenium одновременно (по умолчанию - весь список)
+def extract_company_data(url, fetcher='auto', fixture=None, filters=None):
     try:
-        # Открытие указанной веб-страницы
-        browser.get(url)
-
-        # Ожидание для полной загрузки страницы
-        time.sleep(10)  # Ждем 10 секунд, а не 20, как указано в комментарии
-
-        # Поиск элемента input по его атрибуту ng-model на странице
-        input_element = browser.find_element(By.CSS_SELECTOR, 'input[ng-model="vm.iprFilter.esName"]')
-
-        # Создание объекта для выполнения серии действий с элементом
-        actions = ActionChains(browser)
-
-        # Перемещение к элементу и клик по нему
-        actions.move_to_element(input_element).click().perform()
-
-        # Ожидание для загрузки контента после действия
-        time.sleep(5)
-
-        # Получение данных о компаниях с веб-страницы
-        company_elements = browser.find_elements(By.CSS_SELECTOR, 'li')  # Необходимо уточнить CSS-селектор
-
-        companies = []  # Список для хранения данных о компаниях
-        for elem in company_elements:
-            text = elem.text
-            match = re.match(r"^(.+) \((\d+)\)$", text)  # Проверка текста элемента на соответствие шаблону
-            if match:
-                # Извлечение названия компании и ИНН из текста
-                company_name = match.group(1)
-                inn = match.group(2)  # ИНН сохраняется как строка
-
-        # Произведение замен в названии компании для укорочения формы записи
-        company_name = company_name.replace("Общество с ограниченной ответственностью", "ООО")
-        company_name = company_name.replace("Закрытое акционерное", "ЗАО")
-        company_name = company_name.replace("Акционерное общество", "АО")
-        company_name = company_name.replace("Муниципальное унитарное предприятие", "МУП")
-        company_name = company_name.replace("Акционерное Общество", "АО")
-        company_name = company_name.replace("Общество с ограниченной ответственность", "ООО")
-
-        # Добавление статуса и текущей даты/времени к данным компании
-        status = "Действующая"  # Статус компании, возможно, потребуется получать из другого источника
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')  # Форматирование текущей даты и времени
-
-        # Добавление собранной информации о компании в список
-        companies.append({"NAME_GOSUSLUGI": company_name, "INN": inn, "STATUS": status, "DATE/TIME": timestamp})
-
+        return fetch_companies(url, fetcher, fixture, filters)
     except Exception as e:
         # В случае ошибки выводится сообщение
         print(f"An error occurred: {e}")
-    finally:
-        # Закрытие браузера после завершения работы
-        browser.quit()
-
-    # Возврат списка с данными о компаниях
-    return companies
-
-# Функция для чтения файла Excel с данными о компаниях
-def read_excel(file_name="companies.xlsx"):
-    # Проверка наличия файла
-    if os.path.exists(file_name):
-        # Чтение файла с указанием типа данных для колонки ИНН
-        return pd.read_excel(file_name, dtype={'INN': str}, engine='openpyxl')
-    else:
-        # В случае отсутствия файла возвращается пустой DataFrame
-        return pd.DataFrame()
-
-# Функция для создания резервной копии старой версии файла
-def backup_old_version(file_name="companies.xlsx"):
-    # Проверка существования папки backup, если нет - создание
-    if not os.path.exists("backup"):
-        os.mkdir("backup")
-    # Форматирование текущей даты и времени для создания уникального имени файла
-    timestamp = datetime.now().strftime('%d-%m-%Y %H-%M-%S')
-    # Копирование файла в папку backup с новым именем
-    shutil.copy(file_name, os.path.join("backup", f"{timestamp}.xlsx"))
+        return []
+
+# Функция для создания резервной копии старой версии данных: снимок хранилища в snapshots.sqlite.
+# Сохраняются только изменившиеся строки; старые снимки удаляются по политике хранения
+def backup_old_version(conn):
+    snapshots = SNAPSHOTS.connect()
+    SNAPSHOTS.take_snapshot(snapshots, STORE.load_companies(conn))
+    SNAPSHOTS.prune(snapshots)
+    snapshots.close()
+
+# Список ИНН, которые необходимо исключить из обработки
+EXCLUDE_INNS = ["999999999", "52561056945", "3023011567", "5012060636", "007704726225"]
+
+# Функция для разделения компаний на новые, исчезнувшие из списка и общие операциями над множествами ИНН
+def split_companies(old_data, companies, exclude_inns=EXCLUDE_INNS):
+    old_inns = pd.Index(old_data["INN"].unique())
+    new_inns = pd.Index(companies["INN"].unique())
+    common = old_inns.intersection(new_inns)  # ИНН, которые есть и в хранилище, и в новом списке
+    removed = old_inns.difference(new_inns)  # ИНН, которые исчезли из нового списка
+    added_inns = new_inns.difference(old_inns).difference(pd.Index(exclude_inns))  # Новые ИНН без исключённых
+    added = companies[companies["INN"].isin(added_inns)].copy()
+    return added, removed, common
 
 # Функция для сравнения и обновления данных о компаниях
 def compare_and_update(companies):
-    # Список ИНН, которые необходимо исключить из обработки
-    exclude_inns = ["999999999", "52561056945", "3023011567", "5012060636", "007704726225"]
-
-    # Чтение данных из файла Excel
-    old_data = read_excel()
+    # Чтение данных из хранилища
+    conn = STORE.connect()
+    old_data = STORE.load_dataframe(conn)
 
     if not old_data.empty:
-        # Создание резервной копии файла, если он не пуст
-        backup_old_version()
+        # Создание резервной копии, если хранилище не пусто
+        backup_old_version(conn)
 
-    # Удаление метки 'NEW' у компаний, которые уже есть в списке
-    common_inns = old_data[old_data["INN"].isin(companies["INN"])]["INN"]
-    old_data.loc[old_data["INN"].isin(common_inns), 'COLOR'] = np.nan
+    added, removed, common = split_companies(old_data, companies)
 
-    # Выделение новых компаний, исключая заданные ИНН
-    added = companies[~companies["INN"].isin(old_data["INN"]) & ~companies["INN"].isin(exclude_inns)].copy()
+    # Удаление метки 'NEW' у компаний, которые уже есть в списке (только у отмеченных)
+    marked = old_data[(old_data["COLOR"] == "NEW") & old_data["INN"].isin(common)]["INN"]
+    STORE.clear_color(conn, marked.unique())
 
     # Присвоение номеров новым компаниям
     if not old_data.empty:
@@ -140,41 +73,114 @@ def compare_and_update(companies):
     # Пометка новых компаний
     added['COLOR'] = 'NEW'
 
-    # Объединение новых и старых данных
-    combined_data = pd.concat([old_data, added], ignore_index=True)
-
-    # Сохранение обновленного файла
-    save_to_excel(combined_data, "companies.xlsx")
-
-# Функция для сохранения данных в файл Excel с учетом цветовой маркировки
-def save_to_excel(companies, file_name):
-    # Создание ExcelWriter для записи данных
-    writer = pd.ExcelWriter(file_name, engine='xlsxwriter')
-    companies.to_excel(writer, index=False)
-    worksheet = writer.sheets['Sheet1']
-
-    # Форматирование для выделения новых данных цветом
-    green_format = writer.book.add_format({'bg_color': '#00FF00'})
-
-    # Применение форматирования к новым данным
-    for index, row in companies.iterrows():
-        color = row.get('COLOR')
-        if color == 'NEW':
-            for col_num, value in enumerate(row):
-                # Пропуск столбца 'COLOR' и пустых ячеек
-                if pd.notnull(value):
-                    worksheet.write(index + 1, col_num, value, green_format)
-
-    # Закрытие и сохранение файла
-    writer.close()
-
-# Основная часть скрипта
-url = "https://invest.gosuslugi.ru/epgu-forum/#/ipr"  # URL для извлечения данных
-companies = extract_company_data(url)  # Получение данных о компаниях
-companies = pd.DataFrame(companies)  # Преобразование списка в DataFrame
-compare_and_update(companies)  # Сравнение и обновление данных
-
-# Запуск дополнительных скриптов после основной логики
-subprocess.run(["python", "CHECK_STATUS.py"])  # Скрипт для проверки статуса
-subprocess.run(["python", "YA_DISK.py"])  # Скрипт для работы с Яндекс.Диском
-subprocess.run(["python", "GOOGLE_SHEETS.py"])  # Скрипт для работы с Google Sheets
+    # Добавление новых компаний в хранилище
+    STORE.add_companies(conn, added)
+    conn.commit()
+    conn.close()
+    logging.info(f'Компании: новых {len(added)}, исчезли из списка {len(removed)}, без изменений {len(common)}')
+
+STAGES = ['scrape', 'check_status', 'ya_disk', 'google_sheets', 'export']  # Этапы в порядке выполнения
+
+
+# Функция для разбора аргументов командной строки
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Сбор списка компаний ИПР и обновление данных о них')
+    parser.add_argument('--fetcher', choices=['auto', 'http', 'selenium'], default='auto',
+                        help='Способ загрузки списка компаний (http пока не рабочий: не задан SCRAPER.IPR_API_URL)')
+    parser.add_argument('--fixture', help='Сохранённый JSON-ответ вместо запроса к сайту (для режима http)')
+    parser.add_argument('--filters', default='',
+                        help='Значения фильтра по названию через запятую для загрузки через Selenium')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'Этапы через запятую (по умолчанию все): {", ".join(STAGES)}')
+    parser.add_argument('--profile', nargs='?', const=','.join(STAGES), default='',
+                        help=f'Этапы через запятую, выполняемые под cProfile (без значения - все); '
+                             f'результаты сохраняются в {METRICS.PROFILE_DIR}')
+    args = parser.parse_args(argv)
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    args.filters = [value.strip() for value in args.filters.split(',') if value.strip()]
+    args.profile = [stage.strip() for stage in args.profile.split(',') if stage.strip()]
+    unknown = (set(args.stages) | set(args.profile)) - set(STAGES)
+    if unknown:
+        parser.error(f'Неизвестные этапы: {", ".join(sorted(unknown))}')
+    return args
+
+
+# Функция этапа сбора списка компаний и обновления хранилища
+def scrape(args):
+    url = "https://invest.gosuslugi.ru/epgu-forum/#/ipr"  # URL для извлечения данных
+    companies = extract_company_data(url, args.fetcher, args.fixture, args.filters)  # Получение данных о компаниях
+    if not companies:
+        logging.error('Список компаний не получен, хранилище не изменено')
+        return
+    companies = pd.DataFrame(companies)  # Преобразование списка в DataFrame
+    compare_and_update(companies)  # Сравнение и обновление данных
+
+
+# Функция этапа выгрузки итоговых данных из хранилища в companies.xlsx
+def export():
+    conn = STORE.connect()
+    STORE.export_excel(conn)
+    conn.close()
+
+
+# Функция запуска одного этапа с замером времени (и профилированием, если запрошено);
+# ошибка этапа не останавливает остальные
+def run_stage(name, func, timings, profile=False):
+    started = time.monotonic()
+    try:
+        with METRICS.stage(name, profile):
+            func()
+    except Exception as e:
+        logging.error(f'Этап {name} завершился ошибкой: {e}', exc_info=True)
+    timings[name] = time.monotonic() - started
+    logging.info(f'Этап {name}: {timings[name]:.2f} с')
+
+
+# Основная часть скрипта: выполнение выбранных этапов в одном процессе
+def main(argv=None):
+    args = parse_args(argv)
+    timings = {}  # Время выполнения каждого этапа
+
+    if 'scrape' in args.stages:
+        run_stage('scrape', lambda: scrape(args), timings, 'scrape' in args.profile)
+
+    # Имя папки на Яндекс.Диске строится из NAME_FOR_FOLDER, который записывает check_status, поэтому
+    # ya_disk выполняется после него и сам читает из хранилища список компаний с новыми именами. Одновременно с проверкой
+    # статусов читается только содержимое родительской папки на Диске - оно не зависит от списка компаний
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        parent = executor.submit(YA_DISK.parent_index, YA_DISK.API_TOKEN) if 'ya_disk' in args.stages else None
+        if 'check_status' in args.stages:
+            run_stage('check_status', lambda: CHECK_STATUS.main([]), timings, 'check_status' in args.profile)
+        if parent is not None:
+            try:
+                index = parent.result()
+            except Exception as e:
+                # Родительская папка будет прочитана заново внутри этапа
+                logging.warning(f'Содержимое папки {YA_DISK.PARENT_PATH} не получено заранее: {e}')
+                index = None
+            run_stage('ya_disk', lambda: YA_DISK.main([], index=index), timings, 'ya_disk' in args.profile)
+
+    # Выгрузка в Google Sheets и Excel - после завершения обоих этапов
+    if 'google_sheets' in args.stages:
+        run_stage('google_sheets', GOOGLE_SHEETS.main, timings, 'google_sheets' in args.profile)
+    if 'export' in args.stages:
+        run_stage('export', export, timings, 'export' in args.profile)
+
+    logging.info('Время этапов: ' + ', '.join(f'{name} {seconds:.2f} с' for name, seconds in timings.items()))
+    # Метрики в формате Prometheus и сводка запуска в runs.jsonl (со сводкой пула браузеров, если он использовался)
+    browsers = {'browser_pool': BROWSER_POOL.pool.summary()} if BROWSER_POOL.pool is not None else {}
+    METRICS.write_reports(stages_requested=args.stages, **browsers)
+    return timings
+
+
+if __name__ == '__main__':
+    # Конфигурация логгирования
+    logging.basicConfig(
+        level=logging.INFO,  # Устанавливаем уровень логгирования - INFO
+        format='%(asctime)s - %(levelname)s - %(message)s',  # Формат вывода логов
+        handlers=[
+            logging.FileHandler('changes.log', mode='a'),  # Логи дописываются в конец файла changes.log
+            logging.StreamHandler()  # Логи также будут выводиться в стандартный поток вывода
+        ]
+    )
+    main()